@@ -1,6 +1,89 @@
 # Copyright 2014-2024 XMOS LIMITED.
 # This Software is subject to the terms of the XMOS Public Licence: Version 1.
 
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import warnings
+from pathlib import Path
+import pytest
+from spdif_frames import stream_cache
+from spdif_levels import DEFAULT_LEVEL, LEVELS, level_rule, select
+from spdif_trace import finish_trace
+
+# Local record of how long each test took when it last passed, used to run the longest tests first
+DEFAULT_TEST_HISTORY = Path(__file__).parent / ".test_history.json"
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--level",
+        choices=LEVELS,
+        default=DEFAULT_LEVEL,
+        help="How many of the parametrizations of the tests marked test_levels to run, see spdif_levels.py",
+    )
+    parser.addoption(
+        "--test-history",
+        default=str(DEFAULT_TEST_HISTORY),
+        help="File recording the wall time and simulated cycles of each test, used to order the tests",
+    )
+    parser.addoption(
+        "--no-cost-order",
+        action="store_true",
+        help="Run the tests in collection order rather than longest first",
+    )
+    parser.addoption(
+        "--plan-from-history",
+        action="store_true",
+        help="Plan the streams of the receiver tests from the lock time measured when each last passed, "
+        "rather than from the fixed estimate in their test_params.json (see Stream_plan)",
+    )
+    parser.addoption(
+        "--lock-report",
+        help="File to write the receiver lock times measured by each test to, as JSON",
+    )
+    parser.addoption(
+        "--tx-timing-report",
+        help="File to write the timing of the transmitter output measured by each test to, as JSON",
+    )
+    parser.addoption(
+        "--callback-report",
+        help="File to write the simulator callbacks made and saved by the Python transmitter in each test to, as JSON",
+    )
+    parser.addoption(
+        "--relock-report",
+        help="File to write the receiver relock times measured after each change of stream to, as JSON",
+    )
+    parser.addoption(
+        "--latency-report",
+        help="File to write the spdif_tx to spdif_rx latency measured by test_loopback_latency to, as JSON",
+    )
+    parser.addoption(
+        "--mips-report",
+        help="File to write the minimum MIPS per thread found by test_rx_mips_headroom to, as JSON",
+    )
+    parser.addoption(
+        "--trace-dir",
+        help="Directory to write a binary trace of the subframes seen in each test's simulation to, see spdif_trace.py",
+    )
+    parser.addoption(
+        "--rerun-sims",
+        action="store_true",
+        help="Run every simulation rather than replaying passes from the simulation cache (see Sim_cache)",
+    )
+    parser.addoption(
+        "--batch-sims",
+        action="store_true",
+        help="Run the tests marked sim_batch that use the same xe in one simulation, use --dist loadgroup with xdist",
+    )
+
+
+# Runs before xdist's own hook, which with --dist loadgroup rewrites the node ids of the tests given an
+# xdist_group here (see Sim_batches)
+@pytest.hookimpl(tryfirst=True)
 def pytest_collection_modifyitems(config, items):
     selected = []
     deselected = []
@@ -13,11 +96,566 @@ def pytest_collection_modifyitems(config, items):
                 deselected.append(item)
             else:
                 selected.append(item)
+        else:
+            selected.append(item)
+
+    # The rule for the level is applied to all of the parametrizations of a test together, as pairwise selection
+    # depends on which others are run
+    level = config.getoption("level")
+    tests = {}
+    dropped = set()
+    for item in selected:
+        if item.get_closest_marker("test_levels"):
+            tests.setdefault(item.nodeid.split("[")[0], []).append(item)
+    for test_items in tests.values():
+        m = test_items[0].get_closest_marker("test_levels")
+        factors = m.kwargs.get("factors") or dict
+        combinations = [factors(**item.callspec.params) for item in test_items]
+        keep = set(select(combinations, level_rule(m.kwargs["spec"], level)))
+        dropped.update(item for idx, item in enumerate(test_items) if idx not in keep)
+    deselected.extend(item for item in selected if item in dropped)
+    selected = [item for item in selected if item not in dropped]
 
     config.hook.pytest_deselected(items=deselected)
     items[:] = selected
 
+    if not config.getoption("no_cost_order"):
+        # A stable sort, so tests of equal cost stay in collection order and every xdist worker
+        # ends up with an identical collection
+        costs = config.pluginmanager.get_plugin("test_history").costs(items)
+        items.sort(key=lambda item: -costs[item.nodeid])
+
+    sim_batches = config.pluginmanager.get_plugin("sim_batches")
+    if sim_batches is not None:
+        sim_batches.group(items)
+
 def pytest_configure(config):
     config.addinivalue_line(
         "markers", "uncollect_if(*, func) : function to deselect tests from parametrization"
-    )
\ No newline at end of file
+    )
+    config.addinivalue_line(
+        "markers",
+        "cost_estimate(*, func) : function estimating the simulated core cycles of a test from its parametrization",
+    )
+    config.addinivalue_line(
+        "markers",
+        "test_levels(*, spec, factors=None) : rule for each test level selecting which parametrizations to run",
+    )
+    config.addinivalue_line(
+        "markers",
+        "sim_batch(*, case, run) : functions giving the Sim_case of a test from its parametrization, and running a batch of them",
+    )
+    # The caches are kept in pytest's cache directory unless their environment variables choose another, see
+    # Stream_cache in spdif_frames.py and Sim_cache in spdif_test_utils.py
+    cache = getattr(config, "cache", None)
+    if cache is not None:
+        os.environ.setdefault("SPDIF_STREAM_CACHE", str(cache.mkdir("spdif_stream_cache")))
+        os.environ.setdefault("SPDIF_SIM_CACHE", str(cache.mkdir("spdif_sim_cache")))
+    config.pluginmanager.register(Test_history(config), "test_history")
+    config.pluginmanager.register(Cache_stats(config), "cache_stats")
+    if config.getoption("rerun_sims"):
+        from spdif_test_utils import sim_cache
+
+        sim_cache.rerun = True
+    if config.getoption("batch_sims"):
+        config.pluginmanager.register(Sim_batches(config), "sim_batches")
+    is_worker = hasattr(config, "workerinput")
+    if config.getoption("lock_report"):
+        config.pluginmanager.register(
+            Results_report(
+                config.getoption("lock_report"), "lock_times", "Lock time", _describe_lock_times, is_worker
+            ),
+            "lock_report",
+        )
+    if config.getoption("tx_timing_report"):
+        config.pluginmanager.register(
+            Results_report(
+                config.getoption("tx_timing_report"), "tx_timing", "TX timing", _describe_tx_timing, is_worker
+            ),
+            "tx_timing_report",
+        )
+    if config.getoption("callback_report"):
+        config.pluginmanager.register(
+            Results_report(
+                config.getoption("callback_report"), "tx_callbacks", "TX callbacks", _describe_tx_callbacks, is_worker
+            ),
+            "callback_report",
+        )
+    if config.getoption("relock_report"):
+        config.pluginmanager.register(
+            Results_report(
+                config.getoption("relock_report"),
+                "relock_times",
+                "Relock time",
+                _describe_relock_times,
+                is_worker,
+                summarize=_relock_statistics,
+            ),
+            "relock_report",
+        )
+    if config.getoption("latency_report"):
+        config.pluginmanager.register(
+            Results_report(
+                config.getoption("latency_report"), "latency", "Latency", _describe_latency, is_worker
+            ),
+            "latency_report",
+        )
+    if config.getoption("mips_report"):
+        config.pluginmanager.register(
+            Results_report(
+                config.getoption("mips_report"), "mips_headroom", "MIPS headroom", _describe_mips, is_worker
+            ),
+            "mips_report",
+        )
+
+
+#####
+# Results recorded by the simulator threads while a test runs (see record_sim_result() in
+# spdif_test_utils.py) are read back once it has finished and attached to its report as user
+# properties, so that they also reach the controller when running under xdist.
+#
+# With --trace-dir the simulator threads are also given a trace file named after the test, through
+# the SPDIF_TRACE_FILE environment variable. A test that runs several simulations keeps the last, and
+# the trace of one that ended before it could be saved is written from what was recorded.
+#####
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    fd, path = tempfile.mkstemp(prefix="spdif_sim_results_")
+    os.close(fd)
+    os.environ["SPDIF_SIM_RESULTS_FILE"] = path
+    trace_dir = item.config.getoption("trace_dir")
+    if trace_dir:
+        name = "".join(c if c.isalnum() or c in "-_." else "_" for c in item.nodeid)
+        os.environ["SPDIF_TRACE_FILE"] = str(Path(trace_dir) / f"{name}.npz")
+    try:
+        yield
+    finally:
+        del os.environ["SPDIF_SIM_RESULTS_FILE"]
+        trace_file = os.environ.pop("SPDIF_TRACE_FILE", None)
+        if trace_file:
+            # A simulation ended by --max-cycles or a timeout leaves its trace unsaved
+            finish_trace(trace_file)
+        with open(path) as f:
+            for line in f:
+                item.user_properties.extend(json.loads(line).items())
+        os.remove(path)
+
+
+#####
+# Test_history records the wall time and simulated core cycles of each test that passes, and uses
+# them to estimate how long each test will take on the next run, in seconds.
+#
+# A test that has passed before is expected to take as long as it did last time. Otherwise the
+# function in its cost_estimate marker gives the simulated core cycles, which are converted to
+# seconds using the median seconds per estimated cycle of the tests already in the history. With
+# no history at all the estimated cycles are used as they are, which is enough to order the tests.
+#
+# The simulated cycles are recorded by the simulator threads (see record_sim_cycles() in
+# spdif_test_utils.py) and reach the history through the test report, so also under xdist.
+#
+# The time the receiver took to output its first sample, from the lock times recorded by
+# Port_monitor, is kept too and with --plan-from-history given to the test by the measured_lock_ns
+# fixture, so it can plan a shorter stream (see Stream_plan in spdif_frames.py). It is dropped when
+# the test fails, in case the plan was too short, so the next run falls back to the default plan.
+#####
+class Test_history:
+    __test__ = False  # not a test class, despite the name
+
+    def __init__(self, config):
+        self._path = Path(config.getoption("test_history"))
+        # Under xdist only the controller sees every result, so only it writes the history
+        self._is_worker = hasattr(config, "workerinput")
+        self._history = self._load()
+        self._results = {}
+        self._failed = set()
+
+    def _load(self):
+        try:
+            return json.loads(self._path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def costs(self, items):
+        cycles = {item.nodeid: self._estimate_cycles(item) for item in items}
+        ratios = [
+            self._history[nodeid]["duration"] / cycles[nodeid]
+            for nodeid in cycles
+            if nodeid in self._history and cycles[nodeid]
+        ]
+        seconds_per_cycle = statistics.median(ratios) if ratios else 1
+        return {
+            nodeid: (
+                self._history[nodeid]["duration"]
+                if nodeid in self._history
+                else cycles[nodeid] * seconds_per_cycle
+            )
+            for nodeid in cycles
+        }
+
+    @staticmethod
+    def _estimate_cycles(item):
+        m = item.get_closest_marker("cost_estimate")
+        if m is None or not hasattr(item, "callspec"):
+            return 0
+        return m.kwargs["func"](**item.callspec.params)
+
+    def lock_ns(self, nodeid):
+        return self._history.get(nodeid, {}).get("lock_ns")
+
+    def pytest_runtest_logreport(self, report):
+        if report.when != "call":
+            return
+        if report.outcome != "passed":
+            self._failed.add(report.nodeid)
+            return
+        # A simulation replayed from the cache took no time, so the history of when it ran is kept
+        if any(name == "sim_cached" for name, _ in report.user_properties):
+            return
+        result = {"duration": round(report.duration, 3)}
+        for name, value in report.user_properties:
+            if name == "sim_cycles":
+                result["sim_cycles"] = value
+            elif name == "lock_times" and value and value[0]["first_sample_ns"] is not None:
+                result["lock_ns"] = value[0]["first_sample_ns"]
+        self._results[report.nodeid] = result
+
+    def pytest_sessionfinish(self, session):
+        if self._is_worker or not (self._results or self._failed):
+            return
+        # Merge with the file as it is now, which another session may have updated
+        history = self._load()
+        history.update(self._results)
+        for nodeid in self._failed:
+            history.get(nodeid, {}).pop("lock_ns", None)
+        tmp = self._path.with_name(self._path.name + ".tmp")
+        tmp.write_text(json.dumps(history, indent=1, sort_keys=True))
+        os.replace(tmp, self._path)
+
+
+#####
+# With --plan-from-history, the time the receiver took to output its first sample when this test last
+# passed, in simulated ns. None if it has not been measured, and always without the option, so that
+# by default a test simulates the same stream whatever ran before it.
+#####
+@pytest.fixture
+def measured_lock_ns(request):
+    if not request.config.getoption("plan_from_history"):
+        return None
+    return request.config.pluginmanager.get_plugin("test_history").lock_ns(request.node.nodeid)
+
+
+# The (run, xe) key of the batch of a test marked sim_batch, and its Sim_case
+_sim_batch_case = pytest.StashKey()
+
+
+#####
+# Sim_batches runs the tests marked sim_batch that use the same xe in one simulation, so the xe is loaded and the
+# simulator started once rather than for every test. The case function of the marker gives the Sim_case of each test
+# from its parametrization, and the run function runs the streams of a batch of them one after another, as
+# run(xe, streams, capfd), recording whether each stream was received correctly (the "segment_results" recorded by
+# Port_monitor).
+#
+# The batch is run by the first of its tests to call the sim_batch_passed fixture, and each test then passes if all
+# of its streams were received correctly. Any other test runs on its own, as it would without --batch-sims, so a
+# failure is reported with the output of its own simulation. Under xdist the tests of a batch are put in the same
+# xdist_group, which only keeps them on the same worker with --dist loadgroup.
+#####
+class Sim_batches:
+    def __init__(self, config):
+        self._use_xdist_group = config.pluginmanager.hasplugin("xdist")
+        self._batches = {}
+        self._results = {}
+
+    # The batch of each test is kept in its stash, as xdist changes the node id, and so the hash, of the tests given
+    # an xdist_group
+    def group(self, items):
+        for item in items:
+            m = item.get_closest_marker("sim_batch")
+            if m is None:
+                continue
+            case = m.kwargs["case"](**item.callspec.params)
+            key = (m.kwargs["run"], case.xe)
+            item.stash[_sim_batch_case] = (key, case)
+            self._batches.setdefault(key, []).append(item)
+            if self._use_xdist_group:
+                item.add_marker(pytest.mark.xdist_group(f"sim_batch-{Path(case.xe).stem}"))
+
+    # The results of the test's streams, or None if it is not in a batch or was not run correctly in it
+    def passed(self, item, capfd):
+        if _sim_batch_case not in item.stash:
+            return None
+        key, _ = item.stash[_sim_batch_case]
+        batch = self._batches[key]
+        if len(batch) < 2:
+            return None
+        if key not in self._results:
+            self._results[key] = self._run(key, capfd)
+        return self._results[key].get(next(idx for idx, other in enumerate(batch) if other is item))
+
+    # The results of the tests that passed, by their index in the batch
+    def _run(self, key, capfd):
+        from spdif_test_utils import batch_segments
+
+        run, xe = key
+        batch = self._batches[key]
+        # Tests of a single stream first, so they start from the same state as they would on their own
+        order = sorted(range(len(batch)), key=lambda idx: len(batch[idx].stash[_sim_batch_case][1].segments))
+        segments, case_segments = batch_segments([batch[idx].stash[_sim_batch_case][1] for idx in order])
+
+        fd, path = tempfile.mkstemp(prefix="spdif_sim_batch_")
+        os.close(fd)
+        saved = os.environ.get("SPDIF_SIM_RESULTS_FILE")
+        os.environ["SPDIF_SIM_RESULTS_FILE"] = path
+        results = {}
+        try:
+            run(xe, segments, capfd)
+            with open(path) as f:
+                for line in f:
+                    results.update(json.loads(line))
+        except Exception as e:
+            # The tests run on their own instead, which reports the problem. A warning rather than printing,
+            # which would be in the output captured by the test that ran the batch.
+            warnings.warn(f"Batch of {len(batch)} tests using {xe} failed, running them on their own: {e}")
+        finally:
+            if saved is None:
+                del os.environ["SPDIF_SIM_RESULTS_FILE"]
+            else:
+                os.environ["SPDIF_SIM_RESULTS_FILE"] = saved
+            os.remove(path)
+
+        segment_results = results.get("segment_results", [])
+        lock_times = results.get("lock_times", [])
+        passed = {}
+        for test_idx, indices in zip(order, case_segments):
+            if all(idx < len(segment_results) and segment_results[idx] for idx in indices):
+                passed[test_idx] = {"lock_times": [lock_times[idx] for idx in indices if idx < len(lock_times)]}
+        return passed
+
+
+#####
+# For a test marked sim_batch, a function returning True if the test passed in a batch with --batch-sims, in which
+# case the test has nothing left to do. The lock times of its streams in the batch are added to its results.
+#####
+@pytest.fixture
+def sim_batch_passed(request, capfd):
+    def passed():
+        sim_batches = request.config.pluginmanager.get_plugin("sim_batches")
+        result = sim_batches.passed(request.node, capfd) if sim_batches is not None else None
+        if result is None:
+            return False
+        request.node.user_properties.extend(result.items())
+        return True
+
+    return passed
+
+
+#####
+# Results_report writes one result recorded by each test to a JSON file, eg. the receiver lock times
+# recorded by Port_monitor (see spdif_test_utils.py) for --lock-report, or the transmitter output
+# timing recorded by Spdif_rx for --tx-timing-report. Each test is listed by its id, with its
+# outcome and simple parameters (eg. sam_freq and sample_freq_estimate), and the commit is included
+# so that reports from different commits can be compared. The terminal summary lists the results
+# too, as given by describe(result). Given summarize, each test also has the "summary" given by
+# summarize(result), eg. the statistics of the relock times for --relock-report.
+#####
+class Results_report:
+    def __init__(self, path, name, title, describe, is_worker, summarize=None):
+        self._path = Path(path)
+        self._name = name
+        self._title = title
+        self._describe = describe
+        self._summarize = summarize
+        self._is_worker = is_worker
+        self._tests = {}
+
+    # Runs where the test item is, which under xdist is a worker, so the parameters are added to the report
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+        if report.when != "call" or not hasattr(item, "callspec"):
+            return
+        if any(name == self._name for name, _ in report.user_properties):
+            params = {
+                name: value if isinstance(value, (int, float, str)) else str(getattr(value, "file_name", value))
+                for name, value in item.callspec.params.items()
+            }
+            report.user_properties.append(("test_params", params))
+
+    def pytest_runtest_logreport(self, report):
+        if report.when != "call":
+            return
+        properties = dict(report.user_properties)
+        if self._name in properties:
+            self._tests[report.nodeid] = {
+                "outcome": report.outcome,
+                "params": properties.get("test_params", {}),
+                self._name: properties[self._name],
+            }
+            if self._summarize:
+                self._tests[report.nodeid]["summary"] = self._summarize(properties[self._name])
+
+    def pytest_sessionfinish(self, session):
+        if self._is_worker:
+            return
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                cwd=Path(__file__).parent,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        self._path.write_text(
+            json.dumps({"commit": commit, "tests": self._tests}, indent=1, sort_keys=True)
+        )
+
+    def pytest_terminal_summary(self, terminalreporter):
+        for nodeid, test in sorted(self._tests.items()):
+            terminalreporter.write_line(f"{self._title} {nodeid}: {self._describe(test[self._name])}")
+
+
+def _describe_lock_times(lock_times):
+    return ", ".join(
+        f"{lock['first_sample_ns']} ns to first sample, {lock['first_z_ns']} ns to first Z"
+        for lock in lock_times
+    )
+
+
+def _describe_tx_timing(timing):
+    mclk = f" with a {timing['mclk_Hz']} Hz master clock" if timing.get("mclk_Hz") else ""
+    return (
+        f"{timing['drift_ppm']:+.1f} ppm from nominal{mclk}, worst edge {timing['max_time_deviation_ui']:.3f} UI, "
+        f"worst pulse width {timing['max_interval_deviation_ui']:.3f} UI"
+    )
+
+
+def _describe_tx_callbacks(callbacks):
+    made, saved = callbacks["made"], callbacks["saved"]
+    fewer = f" ({(made + saved) / made:.1f}x fewer)" if made else ""
+    return f"{made} simulator callbacks made, {saved} saved{fewer}"
+
+
+# The distribution of the time to the start of the clean subframes after each change of sample rate, by
+# "from->to" sample rates. The times are None for a change that never locked.
+def _relock_statistics(relock_times):
+    changes = {}
+    for relock in relock_times:
+        changes.setdefault((relock["from_sam_freq"], relock["to_sam_freq"]), []).append(relock["locked_ns"])
+    statistics_ns = {}
+    for (from_sam_freq, to_sam_freq), times in sorted(changes.items()):
+        locked = [time for time in times if time is not None]
+        if len(locked) > 1:
+            p99 = statistics.quantiles(locked, n=100, method="inclusive")[-1]
+        else:
+            p99 = locked[0] if locked else None
+        statistics_ns[f"{from_sam_freq}->{to_sam_freq}"] = {
+            "changes": len(times),
+            "not_locked": len(times) - len(locked),
+            "min_ns": min(locked) if locked else None,
+            "median_ns": statistics.median(locked) if locked else None,
+            "p99_ns": p99,
+        }
+    return statistics_ns
+
+
+def _describe_relock_times(relock_times):
+    descriptions = []
+    for change, stats in _relock_statistics(relock_times).items():
+        if stats["min_ns"] is None:
+            descriptions.append(f"{change} Hz never locked")
+        else:
+            descriptions.append(
+                f"{change} Hz min {stats['min_ns']} median {stats['median_ns']:.0f} p99 {stats['p99_ns']:.0f} ns "
+                f"({stats['not_locked']} of {stats['changes']} not locked)"
+            )
+    return ", ".join(descriptions)
+
+
+def _describe_latency(latency):
+    return ", ".join(
+        f"{segment['sam_freq']} Hz {segment['min_samples']:.2f}-{segment['max_samples']:.2f} samples "
+        f"({segment['min_ns']:.0f}-{segment['max_ns']:.0f} ns), first {segment['first_ns']:.0f} ns"
+        if "min_ns" in segment
+        else f"{segment['sam_freq']} Hz no samples"
+        for segment in latency
+    )
+
+
+def _describe_mips(mips):
+    if mips["min_mips"] is None:
+        return "no error free point"
+    return (
+        f"{mips['min_mips']:.1f} MIPS per thread ({mips['core_freq']} MHz, {mips['dthreads']} dummy threads), "
+        f"{mips['headroom_mips']:.1f} MIPS below the test_rx configuration"
+    )
+
+
+#####
+# With xdist's default load distribution each worker is first sent a chunk of consecutive tests,
+# which would give all of the longest tests to the first worker. Sending the tests one at a time in
+# the (longest first) collection order gives each worker that becomes free the longest test left.
+#####
+@pytest.hookimpl(optionalhook=True)
+def pytest_xdist_make_scheduler(config, log):
+    if config.getoption("no_cost_order") or config.getoption("dist") != "load":
+        return None
+    from xdist.scheduler import LoadScheduling
+
+    scheduler = LoadScheduling(config, log)
+    scheduler.maxschedchunk = 1
+    return scheduler
+
+
+#####
+# Cache_stats totals the hits and misses of the stream and simulation caches. Under xdist each worker
+# has its own caches, so the workers send their counts to the controller, which adds them up for the
+# terminal summary.
+#####
+class Cache_stats:
+    def __init__(self, config):
+        self._config = config
+        self._worker_stats = []
+
+    @staticmethod
+    def _local():
+        stats = {"stream": stream_cache.stats()}
+        # Only loaded once a simulation test has been collected
+        sim_cache = getattr(sys.modules.get("spdif_test_utils"), "sim_cache", None)
+        if sim_cache is not None:
+            stats["sim"] = sim_cache.stats()
+        return stats
+
+    def pytest_sessionfinish(self, session):
+        if hasattr(self._config, "workeroutput"):
+            self._config.workeroutput["cache_stats"] = self._local()
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        stats = getattr(node, "workeroutput", {}).get("cache_stats")
+        if stats:
+            self._worker_stats.append(stats)
+
+    def totals(self):
+        totals = {}
+        for stats in [self._local()] + self._worker_stats:
+            for name, counts in stats.items():
+                total = totals.setdefault(name, {"hits": 0, "misses": 0})
+                total["hits"] += counts["hits"]
+                total["misses"] += counts["misses"]
+        return totals
+
+    def pytest_terminal_summary(self, terminalreporter):
+        totals = self.totals()
+        stats = totals.get("stream")
+        if stats and (stats["hits"] or stats["misses"]):
+            terminalreporter.write_line(
+                f"S/PDIF stream cache: {stats['hits']} hits, {stats['misses']} misses"
+            )
+        stats = totals.get("sim")
+        if stats and (stats["hits"] or stats["misses"]):
+            terminalreporter.write_line(
+                f"Simulation cache: {stats['hits']} replayed, {stats['misses']} simulated"
+            )
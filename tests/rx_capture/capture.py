@@ -2,31 +2,92 @@
 # This Software is subject to the terms of the XMOS Public Licence: Version 1.
 
 import argparse
+import sys
+import time
 from pathlib import Path
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from spdif_streams import (  # noqa: E402
+    Compact_stream_writer,
+    DEFAULT_SAMPLE_RATE,
+    parse_uints,
+    stream_bits,
+)
 
 parser = argparse.ArgumentParser(
     description="Reads an input file containing one integer per line representing an oversampled S/PDIF input stream and outputs a binary file representation of that input stream"
 )
 parser.add_argument(
     "in_file",
-    help="Path to input file containing the data captured from the S/PDIF input port",
+    help="Path to input file containing the data captured from the S/PDIF input port, or - to read from standard input",
 )
 parser.add_argument(
     "out_file",
     help="Path to output file to create containing the binary representation of the data from the input file",
 )
+parser.add_argument(
+    "--compact",
+    action="store_true",
+    help="Output a compact (run-length) stream file instead of a raw binary stream",
+)
+parser.add_argument(
+    "--sam-freq", type=int, help="Audio sample rate to record in the compact file header"
+)
+parser.add_argument(
+    "--source", default="", help="Description of the source to record in the compact file header"
+)
+parser.add_argument(
+    "--chunk-size", type=int, default=16, help="Size in MB of the text read at a time"
+)
 args = parser.parse_args()
 
 in_file = Path(args.in_file)
 out_file = Path(args.out_file)
+chunk_size = args.chunk_size * 1024 * 1024
 
-if in_file.exists():
-    with open(in_file, "r") as f:
-        lines = f.readlines()
-
-    with open(out_file, "wb") as f:
-        for line in lines:
-            byte_array = int(line).to_bytes(4, "little")
-            f.write(byte_array)
-else:
+if args.in_file != "-" and not in_file.exists():
     print(f"Error: input file {args.in_file} does not exist")
+    sys.exit(1)
+
+start = time.perf_counter()
+bytes_in = 0
+values_in = 0
+with (
+    sys.stdin.buffer if args.in_file == "-" else open(in_file, "rb")
+) as f_in, open(out_file, "wb") as f_out:
+    if args.compact:
+        writer = Compact_stream_writer(
+            f_out, DEFAULT_SAMPLE_RATE, args.sam_freq, args.source
+        )
+    remainder = b""
+    while True:
+        chunk = f_in.read(chunk_size)
+        bytes_in += len(chunk)
+        text = remainder + chunk
+        # Only parse up to the last complete line, unless this is the end of the input
+        end = text.rfind(b"\n") + 1 if chunk else len(text)
+        text, remainder = text[:end], text[end:]
+        values = parse_uints(text)
+        # Each value is a 32 bit port sample, so anything wider is not a capture
+        if len(values) and values.max() > 0xFFFFFFFF:
+            line = values_in + int(np.argmax(values > 0xFFFFFFFF)) + 1
+            raise Exception(f"Value {int(values.max())} on line {line} of the input does not fit in 32 bits")
+        data = values.astype("<u4").tobytes()
+        values_in += len(data) // 4
+        if args.compact:
+            writer.write_bits(stream_bits(data))
+        else:
+            f_out.write(data)
+        if not chunk:
+            break
+    if args.compact:
+        writer.close()
+    bytes_out = f_out.tell()
+
+elapsed = time.perf_counter() - start
+print(
+    f"Converted {values_in} values ({bytes_in / 1e6:.1f} MB of text) to {bytes_out / 1e6:.2f} MB "
+    f"in {elapsed:.2f} s ({bytes_in / 1e6 / max(elapsed, 1e-9):.1f} MB/s)",
+    file=sys.stderr,
+)
@@ -2,21 +2,129 @@
 # This Software is subject to the terms of the XMOS Public Licence: Version 1.
 
 import argparse
+import mmap
+import sys
 from pathlib import Path
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from spdif_streams import COMPACT_MAGIC, load_stream_file  # noqa: E402
 
 parser = argparse.ArgumentParser(
     description="Loads binary data from a file containing an oversample S/PDIF stream, and prints it to standard output"
 )
 parser.add_argument(
-    "in_file", help="Path to file containing binary recorded S/PDIF stream"
+    "in_file", help="Path to file containing binary recorded S/PDIF stream, raw or compact"
+)
+parser.add_argument(
+    "--offset", type=int, default=0, help="First sample (bit) of the window to print"
+)
+parser.add_argument(
+    "--length",
+    type=int,
+    default=None,
+    help="Number of samples (bits) in the window to print, defaults to the rest of the file",
+)
+parser.add_argument(
+    "--runs",
+    action="store_true",
+    help="Print the level and width (in samples, 10 ns at 100 MHz) of each pulse in the window instead of the raw bits",
+)
+parser.add_argument(
+    "--width",
+    type=int,
+    default=0,
+    help="Number of samples to print per line, 0 for a single line",
 )
 args = parser.parse_args()
 
 in_file = Path(args.in_file)
 
+# Samples are stored least significant bit first, so each byte prints reversed
+BYTE_BITS = ["{0:08b}".format(byte)[::-1] for byte in range(256)]
+CHUNK_BYTES = 64 * 1024
+
+
+def print_bits(data, first_bit, no_of_bits, width):
+    column = 0
+    for start in range(0, len(data), CHUNK_BYTES):
+        text = "".join(BYTE_BITS[byte] for byte in data[start : start + CHUNK_BYTES])
+        if start == 0:
+            text = text[first_bit:]
+        text = text[:no_of_bits]
+        no_of_bits -= len(text)
+        while text:
+            if width:
+                line, text = text[: width - column], text[width - column :]
+                column = (column + len(line)) % width
+                sys.stdout.write(line + ("\n" if column == 0 else ""))
+            else:
+                sys.stdout.write(text)
+                text = ""
+    if not width or column:
+        sys.stdout.write("\n")
+
+
+def print_runs(data, first_bit, no_of_bits, width):
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder="little")
+    bits = bits[first_bit : first_bit + no_of_bits]
+    if len(bits) == 0:
+        return
+    # The first and last runs are cut by the edges of the window so may be longer in the file
+    starts = np.concatenate(([0], np.flatnonzero(bits[1:] != bits[:-1]) + 1))
+    widths = np.diff(np.append(starts, len(bits)))
+    runs = [f"{level}:{width}" for level, width in zip(bits[starts].tolist(), widths.tolist())]
+    per_line = max(width // 6, 1) if width else len(runs)
+    for i in range(0, len(runs), per_line):
+        print(" ".join(runs[i : i + per_line]))
+    values, counts = np.unique(widths[1:-1], return_counts=True)
+    print(
+        "Pulse widths: "
+        + ", ".join(f"{value}: {count}" for value, count in zip(values.tolist(), counts.tolist()))
+    )
+
+
+def print_window(data, first_bit, length):
+    if args.runs:
+        print_runs(data, first_bit, length, args.width)
+    else:
+        print_bits(data, first_bit, length, args.width)
+
+
+def window_bounds(total_bits):
+    offset = min(max(args.offset, 0), total_bits)
+    length = total_bits - offset if args.length is None else min(args.length, total_bits - offset)
+    return offset, length
+
+
+def print_raw(f):
+    if Path(f.name).stat().st_size == 0:
+        # An empty file cannot be memory-mapped
+        print_window(b"", 0, 0)
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        offset, length = window_bounds(len(mm) * 8)
+        # Only the bytes in the window are read from the file
+        print_window(mm[offset // 8 : (offset + length + 7) // 8], offset % 8, length)
+
+
+def print_compact(stream):
+    offset, length = window_bounds(len(stream))
+    # Only the runs in the window are expanded to bits
+    edges = stream.edges()
+    first = max(int(np.searchsorted(edges, offset, side="right")) - 1, 0)
+    last = int(np.searchsorted(edges, offset + length, side="left"))
+    runs = stream.runs[first:last]
+    levels = stream.levels()[first:last].astype(np.uint8)
+    bits = np.repeat(levels, runs)[offset - int(edges[first]) :][:length]
+    print_window(np.packbits(bits, bitorder="little").tobytes(), 0, length)
+
+
 if in_file.exists():
     with open(in_file, "rb") as f:
-        content = "".join("{0:08b}".format(byte)[::-1] for byte in f.read())
-    print(content)
+        if f.read(len(COMPACT_MAGIC)) == COMPACT_MAGIC:
+            print_compact(load_stream_file(in_file))
+        else:
+            print_raw(f)
 else:
     print(f"Error: input file {args.in_file} does not exist")
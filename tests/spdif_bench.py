@@ -0,0 +1,221 @@
+# Copyright 2024 XMOS LIMITED.
+# This Software is subject to the terms of the XMOS Public Licence: Version 1.
+
+#####
+# Benchmarks for the host side Python used by the tests: Frames.stream(), Frames.expect(),
+# sub_frame_string(), extract_preamble(), Audio_func and the rx_capture capture/readback scripts.
+# These only need NumPy so can be run without Pyxsim, eg.
+#
+#     python spdif_bench.py --save baseline.json
+#     python spdif_bench.py --compare baseline.json --threshold 1.2
+#
+# Each benchmark is run for every combination of the sample rates in test_rx/test_params.json and
+# the --blocks and --channels given. The time reported is the best of --repeat runs, and with
+# --compare any benchmark slower than the baseline by more than --threshold times is reported and
+# the script exits with an error.
+#####
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import runpy
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+import numpy as np
+from spdif_frames import (
+    Audio_func,
+    Frames,
+    extract_preamble,
+    freq_for_sample_rate,
+    sub_frame_string,
+)
+from spdif_streams import DEFAULT_SAMPLE_RATE
+
+TESTS_DIR = Path(__file__).parent
+CAPTURE_SCRIPT = TESTS_DIR / "rx_capture" / "capture.py"
+READBACK_SCRIPT = TESTS_DIR / "rx_capture" / "readback.py"
+
+with open(TESTS_DIR / "test_rx" / "test_params.json") as f:
+    SAM_FREQS = json.load(f)["SAM_FREQS"]
+
+
+def _frames(sam_freq, blocks, channels):
+    audio = [["ramp", 5 if i % 2 else -7] for i in range(channels)]
+    return Frames(channels=audio, no_of_blocks=blocks, sam_freq=sam_freq)
+
+
+# The transitions of each sub-frame as printed by Spdif_rx, oldest first
+def _transition_strings(stream):
+    levels = np.unpackbits(np.frombuffer(stream, dtype=np.uint8), bitorder="little")
+    transitions = levels ^ np.roll(levels, 1)
+    rows = (transitions.reshape(-1, 64) + ord("0")).astype(np.uint8)
+    return [row.tobytes().decode() for row in rows]
+
+
+# The stream sampled at the rate the recorded streams are captured at, one bit per sample
+def _oversample(stream, sam_freq):
+    levels = np.unpackbits(np.frombuffer(stream, dtype=np.uint8), bitorder="little")
+    no_of_samples = len(levels) * DEFAULT_SAMPLE_RATE // freq_for_sample_rate(sam_freq)
+    cells = np.arange(no_of_samples) * freq_for_sample_rate(sam_freq) // DEFAULT_SAMPLE_RATE
+    return levels[cells]
+
+
+def _run_script(script, out_file, *args):
+    argv = sys.argv
+    sys.argv = [str(script), *map(str, args)]
+    try:
+        with open(out_file, "w") as out:
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+                runpy.run_path(str(script), run_name="__main__")
+    finally:
+        sys.argv = argv
+
+
+#####
+# Each benchmark takes the case parameters and a directory for any files it needs, and returns the
+# function to time. Anything done before returning is setup, and is not timed.
+#####
+def bench_frames_stream(sam_freq, blocks, channels, work_dir):
+    frames = _frames(sam_freq, blocks, channels)
+    return frames.stream
+
+
+def bench_frames_expect(sam_freq, blocks, channels, work_dir):
+    frames = _frames(sam_freq, blocks, channels)
+    return frames.expect
+
+
+def bench_sub_frame_string(sam_freq, blocks, channels, work_dir):
+    subframes = _transition_strings(_frames(sam_freq, blocks, channels).stream())
+    return lambda: [sub_frame_string(i // channels, sub) for i, sub in enumerate(subframes)]
+
+
+def bench_extract_preamble(sam_freq, blocks, channels, work_dir):
+    words = _frames(sam_freq, blocks, channels).words().tolist()
+    return lambda: [extract_preamble(word) for word in words]
+
+
+def bench_audio_func_next(sam_freq, blocks, channels, work_dir):
+    funcs = [Audio_func(*chan) for chan in _frames(sam_freq, blocks, channels)._audio]
+    no_of_samples = blocks * 192
+
+    def run():
+        for func in funcs:
+            value = 0
+            for _ in range(no_of_samples):
+                value = func.next(value)
+
+    return run
+
+
+def bench_audio_func_samples(sam_freq, blocks, channels, work_dir):
+    funcs = [Audio_func(*chan) for chan in _frames(sam_freq, blocks, channels)._audio]
+    no_of_samples = blocks * 192
+    return lambda: [func.samples(0, no_of_samples) for func in funcs]
+
+
+def bench_capture(sam_freq, blocks, channels, work_dir):
+    samples = _oversample(_frames(sam_freq, blocks, channels).stream(), sam_freq)
+    words = np.packbits(samples, bitorder="little")
+    words = np.frombuffer(words[: len(words) // 4 * 4].tobytes(), dtype="<u4")
+    in_file = Path(work_dir) / "capture.txt"
+    in_file.write_text("\n".join(map(str, words.tolist())) + "\n")
+    out_file = Path(work_dir) / "capture.stream"
+    return lambda: _run_script(CAPTURE_SCRIPT, Path(work_dir) / "capture.out", in_file, out_file)
+
+
+def bench_readback(sam_freq, blocks, channels, work_dir):
+    samples = _oversample(_frames(sam_freq, blocks, channels).stream(), sam_freq)
+    in_file = Path(work_dir) / "readback.stream"
+    in_file.write_bytes(np.packbits(samples, bitorder="little").tobytes())
+    return lambda: _run_script(READBACK_SCRIPT, Path(work_dir) / "readback.out", in_file)
+
+
+BENCHMARKS = {
+    name[len("bench_"):]: func for name, func in globals().items() if name.startswith("bench_")
+}
+
+
+def run_benchmarks(names, sam_freqs, blocks, channels, repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in names:
+            for sam_freq in sam_freqs:
+                for no_of_blocks in blocks:
+                    for no_of_channels in channels:
+                        case = f"{name}[{sam_freq}-{no_of_blocks}-{no_of_channels}]"
+                        func = BENCHMARKS[name](sam_freq, no_of_blocks, no_of_channels, work_dir)
+                        timer = timeit.Timer(func)
+                        number, _ = timer.autorange()
+                        results[case] = min(timer.repeat(repeat, number)) / number
+                        print(f"{case:<40} {results[case] * 1000:12.3f} ms", flush=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    slower = []
+    for case, seconds in results.items():
+        if case not in baseline:
+            continue
+        ratio = seconds / baseline[case]
+        if ratio > threshold:
+            slower.append(case)
+            print(
+                f"SLOWER: {case} {baseline[case] * 1000:.3f} ms -> {seconds * 1000:.3f} ms ({ratio:.2f}x)"
+            )
+    missing = [case for case in results if case not in baseline]
+    if missing:
+        print(f"{len(missing)} benchmarks are not in the baseline")
+    print(f"{len(slower)} of {len(results) - len(missing)} benchmarks more than {threshold}x slower")
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the host side S/PDIF test code")
+    parser.add_argument(
+        "benchmarks", nargs="*", help=f"Benchmarks to run, defaults to all of: {', '.join(BENCHMARKS)}"
+    )
+    parser.add_argument("--sam-freqs", type=int, nargs="+", default=SAM_FREQS, help="Audio sample rates")
+    parser.add_argument("--blocks", type=int, nargs="+", default=[1, 10, 100], help="Numbers of 192 sample blocks")
+    parser.add_argument("--channels", type=int, nargs="+", default=[2, 4, 8], help="Numbers of channels")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of times to time each benchmark")
+    parser.add_argument("--save", help="Path to a JSON file to save the results to, for use as a baseline")
+    parser.add_argument("--compare", help="Path to a JSON file of baseline results to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=1.2, help="Ratio to the baseline time above which a benchmark is slower"
+    )
+    args = parser.parse_args(argv)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name}")
+
+    results = run_benchmarks(
+        args.benchmarks or list(BENCHMARKS), args.sam_freqs, args.blocks, args.channels, args.repeat
+    )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                f,
+                indent=1,
+            )
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,671 @@
+# Copyright 2014-2024 XMOS LIMITED.
+# This Software is subject to the terms of the XMOS Public Licence: Version 1.
+
+import hashlib
+import json
+import os
+import tempfile
+import wave
+from pathlib import Path
+import numpy as np
+
+#####
+# These tests analyse the transitions rather than the pin value
+# eg. '011101000' or '100010111' -> '10011100'
+#####
+PREAMBLE_Z = "10011100"
+PREAMBLE_X = "10010011"
+PREAMBLE_Y = "10010110"
+TRANSITIONS_OK = "1111111111111111111111111111"
+TEST_SUBFRAME = PREAMBLE_Y + TRANSITIONS_OK + TRANSITIONS_OK
+
+#####
+# Integer forms of the above. Subframes are held as 32-bit words in the same layout the receiver
+# outputs them (see spdif.h): the preamble in bits 2-3 and the 28 bits of sample, V, U, C and P in
+# bits 4-31. On the line a subframe is 64 half-bit cells; cell k is bit k of a 64-bit transition word.
+#####
+FRAME_Z = 0x8
+FRAME_X = 0xC
+FRAME_Y = 0x0
+PREAMBLE_MASK = 0xC
+
+_PREAMBLE_CELLS = np.zeros(16, dtype=np.uint64)
+_PREAMBLE_CELLS[FRAME_Z] = int(PREAMBLE_Z[::-1], 2)
+_PREAMBLE_CELLS[FRAME_X] = int(PREAMBLE_X[::-1], 2)
+_PREAMBLE_CELLS[FRAME_Y] = int(PREAMBLE_Y[::-1], 2)
+
+# Every other cell after the preamble is a clock transition
+_CLOCK_CELLS = np.uint64(0x5555555555555500)
+
+
+def extract_preamble(subframe: int):
+    pre = subframe & 0xC
+    pre = (
+        "Z"
+        if pre == 0x8
+        else "X"
+        if pre == 0xC
+        else "Y"
+        if pre == 0x0
+        else "{0:02b}".format(pre >> 2)
+    )
+    return pre
+
+
+def _bit_array(bits: str):
+    return np.frombuffer(bits.encode("ascii"), dtype=np.uint8) - ord("0")
+
+
+def _parity(words):
+    # Fold the xor of all bits down into bit 0
+    for shift in (16, 8, 4, 2, 1):
+        words = words ^ (words >> shift)
+    return words & 1
+
+
+def _spread_bits(words):
+    # Moves bit k of each (up to) 32-bit word to bit 2k of a 64-bit word
+    words = words.astype(np.uint64)
+    for shift, mask in (
+        (16, 0x0000FFFF0000FFFF),
+        (8, 0x00FF00FF00FF00FF),
+        (4, 0x0F0F0F0F0F0F0F0F),
+        (2, 0x3333333333333333),
+        (1, 0x5555555555555555),
+    ):
+        words = (words | (words << np.uint64(shift))) & np.uint64(mask)
+    return words
+
+
+def _biphase_mark(words):
+    # Biphase-mark encodes receiver format subframe words into 64-bit words of pin levels, where the
+    # level of cell k is the xor of the transitions in cells k to 63 of that subframe
+    cells = _PREAMBLE_CELLS[words & PREAMBLE_MASK] | _CLOCK_CELLS
+    cells |= _spread_bits(words >> 4) << np.uint64(9)
+    for shift in (1, 2, 4, 8, 16, 32):
+        cells ^= cells >> np.uint64(shift)
+    return cells
+
+
+#####
+# The Frames class constructs an S/PDIF signal either to feed into the simulator to test
+# the receiver or to check an output against. The signal is built as arrays of integers, one
+# 32-bit word per subframe, for all blocks at once.
+#
+# channels / sources are lists of Audio_func arguments, one per channel, eg. [["ramp", 5], ["sine", 1000, 0.5]]
+#
+# .log_initial_value( int value )
+#          used by Port_monitor after the first frame has been observed so that when
+#          .expect() is called to check checks are conducted against a matching
+#
+# .words( start=0, count=None )
+#          outputs an array of subframe words in the receiver's output format, for count samples
+#          (all of them by default) from sample start
+#
+# .iter_words()
+#          yields the same subframe words one at a time, generating them a block at a time, so
+#          checks that stop early do not generate the whole signal
+#
+# .expect()
+#          outputs an array of strings representing the expected decoded spdif signal
+#
+# .stream()
+#          outputs a byte array representing the spdif signal that can be driven on a pin for
+#          the simulator to decode back into spdif data
+#
+#####
+class Frames:
+    def __init__(
+        self,
+        sources=None,
+        channels=None,
+        no_of_blocks=0,
+        # byte 0
+        pro=False,
+        digital_audio=True,
+        copyright=False,
+        preEmphasis="000",
+        mode=0,
+        # byte 1
+        catagory_code="digital/digital converters",
+        catagory="other",
+        L_bit=False,
+        # byte 2
+        # byte 3
+        sam_freq=44100,
+        clock_accuracy="level II",
+        # byte 4
+        bit_depth=24,
+        original_sam_freq=0,  # unknown
+        # byte 5-23
+        extra=None,  # List of bytes
+    ):
+        self._args = {k: v for k, v in locals().items() if k != "self"}
+        self.sam_freq = sam_freq
+        self._no_of_samples = no_of_blocks * 192
+        self._samples = None
+        self._initial_values = []
+        self._first_block = 0
+        if sources is not None:
+            self._audio = sources
+        elif channels is not None:
+            self._audio = channels
+        else:
+            # Error no channels or sources
+            pass
+        self._funcs = [Audio_func(*chan, sam_freq=sam_freq) for chan in self._audio]
+        self._validity_flag = []
+        self._user_data = []
+        self._channel_status = []
+        for i, _ in enumerate(self._audio):
+            self._validity_flag.append("0")
+            self._user_data.append("0")
+            self._channel_status.append(
+                self._get_byte_0(pro, digital_audio, copyright, preEmphasis, mode)
+                + self._get_byte_1(catagory_code, catagory, L_bit)
+                + self._get_byte_2(
+                    i + 1 if sources is not None else 0,
+                    i + 1 if channels is not None else 0,
+                )
+                + self._get_byte_3(sam_freq, clock_accuracy)
+                + self._get_byte_4(bit_depth, original_sam_freq)
+                + self._get_byte_extra(extra)
+            )
+
+    def _get_byte_0(self, pro, digital_audio, copyright, preEmphasis, mode):
+        byte = ""
+        byte += "1" if pro else "0"
+        byte += "1" if not digital_audio else "0"
+        byte += "1" if not copyright else "0"
+        byte += preEmphasis
+        byte += "{:02b}".format(mode)
+        return byte
+
+    def _get_byte_1(self, catagory_code, catagory, L_bit):
+        byte = ""
+        if catagory_code == "digital/digital converters":
+            byte += "010"
+            if catagory == "other":
+                byte += "1111"
+            else:
+                raise Exception(
+                    "Unsupported device catagory, if input is correct please add support to Frames"
+                )
+        else:
+            raise Exception(
+                "Unsupported device catagory, if input is correct please add support to Frames"
+            )
+        byte += "1" if L_bit else "0"
+        return byte
+
+    def _get_byte_2(self, source_No, channel_No):
+        byte = ""
+        byte += "{:04b}".format(source_No)[::-1]
+        byte += "{:04b}".format(channel_No)[::-1]
+        return byte
+
+    def _get_byte_3(self, sam_freq, clock_accuracy):
+        byte = ""
+        if sam_freq == 22050:
+            byte = "0010"
+        elif sam_freq == 44100:
+            byte = "0000"
+        elif sam_freq == 88200:
+            byte = "0001"
+        elif sam_freq == 176400:
+            byte = "0011"
+        elif sam_freq == 24000:
+            byte = "0110"
+        elif sam_freq == 48000:
+            byte = "0100"
+        elif sam_freq == 96000:
+            byte = "0101"
+        elif sam_freq == 192000:
+            byte = "0111"
+        else:
+            raise Exception(
+                "Unsupported Sample rate, if input is correct please add support to Frames"
+            )
+        if clock_accuracy == "level II":
+            byte += "00"
+        else:
+            raise Exception(
+                "Unsupported Clock accuracy, if input is correct please add support to Frames"
+            )
+        byte += "00"
+        return byte
+
+    def _get_byte_4(self, bit_depth, original_sam_freq):
+        # there are 2 options for 20bits this needs sorting for tests that involve a bit depth of 20
+        byte = ""
+        byte += "1" if bit_depth > 20 else "0"
+        if bit_depth in [20, 16]:
+            byte += "100"
+        elif bit_depth in [22, 18]:
+            byte += "010"
+        elif bit_depth in [23, 19]:
+            byte += "001"
+        elif bit_depth in [24, 20]:
+            byte += "101"
+        elif bit_depth in [21, 17]:
+            byte += "011"
+        else:
+            byte += "000"
+        if original_sam_freq == 0:
+            byte += "0000"
+        else:
+            raise Exception(
+                "Unsupported original sample rate, if input is correct please add support to Frames"
+            )
+        return byte
+
+    def _get_byte_extra(self, extra):
+        byte = ""
+        if extra is None:
+            for _ in range(19):
+                byte += "00000000"
+        else:
+            raise Exception(
+                "Unsupported extra data, if input is correct please add support to Frames"
+            )
+        return byte
+
+    # What determines the words of the Frames, for keying caches of anything made from them
+    def description(self):
+        return {
+            "frames": {k: v for k, v in self._args.items() if k not in ["sources", "channels"]},
+            "audio": [func.description() for func in self._funcs],
+            "initial_values": list(self._initial_values),
+        }
+
+    def log_initial_value(self, value):
+        if len(self._initial_values) < len(self._audio):
+            self._initial_values.append(value)
+            if len(self._initial_values) == len(self._audio):
+                self._first_block = self._find_first_block()
+        return len(self._initial_values) == len(self._audio)
+
+    # Signals that do not follow on from the initial value, such as a sine, are expected from the block
+    # of the stream they match, as the receiver may only output from a later block
+    def _find_first_block(self):
+        for block in range(self._no_of_samples // 192):
+            if all(
+                not func.absolute or (int(func.block(0, block)[0]) - value) & 0xFFFFFF == 0
+                for func, value in zip(self._funcs, self._initial_values)
+            ):
+                return block
+        return 0
+
+    def words(self, start=0, count=None):
+        n = self._no_of_samples - start if count is None else count
+        sample_no = np.arange(start, start + n)
+        data = np.empty((n, len(self._audio)), dtype=np.uint32)
+        preambles = np.full(data.shape, FRAME_Y, dtype=np.uint32)
+        preambles[:, 0] = np.where(sample_no % 192 == 0, FRAME_Z, FRAME_X)
+        for i, chan in enumerate(self._audio):
+            value = 0 if i >= len(self._initial_values) else self._initial_values[i]
+            func = self._funcs[i]
+            if func.absolute:
+                samples = func.at((sample_no + self._first_block * 192) % self._no_of_samples)
+            else:
+                samples = func.samples(value, n, start)
+            subframe = (samples & ((1 << 24) - 1)).astype(np.uint32)
+            for shift, bits in (
+                (24, self._validity_flag[i]),
+                (25, self._user_data[i]),
+                (26, self._channel_status[i]),
+            ):
+                bits = _bit_array(bits)
+                subframe |= bits[sample_no % len(bits)].astype(np.uint32) << shift
+            subframe |= _parity(subframe) << 27
+            data[:, i] = subframe
+        return ((data << 4) | preambles).ravel()
+
+    def iter_words(self):
+        for start in range(0, self._no_of_samples, 192):
+            yield from self.words(start, min(192, self._no_of_samples - start)).tolist()
+
+    def expect(self):
+        nch = len(self._audio)
+        return [
+            subframe_word_string(i // nch, word) for i, word in enumerate(self.words().tolist())
+        ]
+
+    def stream(self, quick_start_offset=0, polarity=0):
+        words = self.words()
+        words = np.concatenate((words[quick_start_offset:], words[:quick_start_offset]))
+        levels = _biphase_mark(words)
+        if polarity:
+            levels = ~levels
+        return levels.astype("<u8").tobytes()
+
+
+#####
+# Stream_cache stores the output of Frames.stream() and Frames.expect() on disk so that identical
+# Frames are only generated once across tests, runs and xdist workers.
+#
+# Entries are keyed on a hash of the Frames constructor arguments, any logged initial values, the
+# stream() arguments and the source of this module, so a change to the generator invalidates them.
+# Writes are atomic (write to a temporary file then rename) so workers can share the directory, and
+# the least recently used entries are removed once the directory grows beyond max_bytes.
+#
+# The directory is given by path, or else by the SPDIF_STREAM_CACHE environment variable when the
+# cache is used, which conftest.py sets to a directory in pytest's cache. Without either it is in
+# the user's cache directory, outside the source tree. An empty string disables caching.
+#####
+class Stream_cache:
+    _generator_hash = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+    _env = "SPDIF_STREAM_CACHE"
+    _default_dir = "streams"
+
+    def __init__(self, path=None, max_bytes=256 * 1024 * 1024):
+        self._given_path = path
+        self._max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def stream(self, frames, quick_start_offset=0, polarity=0):
+        key = self._key(
+            frames, "stream", quick_start_offset=quick_start_offset, polarity=polarity
+        )
+        data = self._load(key)
+        if data is None:
+            data = frames.stream(quick_start_offset=quick_start_offset, polarity=polarity)
+            self._store(key, data)
+        return data
+
+    def expect(self, frames):
+        key = self._key(frames, "expect")
+        data = self._load(key)
+        if data is None:
+            expect = frames.expect()
+            self._store(key, "\n".join(expect).encode())
+            return expect
+        return data.decode().split("\n") if data else []
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _key(self, frames, kind, **kwargs):
+        description = {
+            "generator": self._generator_hash,
+            "kind": kind,
+            **frames.description(),
+            **kwargs,
+        }
+        return hashlib.sha256(
+            json.dumps(description, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def _dir(self):
+        path = self._given_path
+        if path is None:
+            user_cache = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+            path = os.environ.get(self._env, Path(user_cache) / "lib_spdif" / self._default_dir)
+        return Path(path) if path else None
+
+    def _load(self, key):
+        path = self._dir()
+        if path is None:
+            self.misses += 1
+            return None
+        entry = path / key
+        try:
+            data = entry.read_bytes()
+            os.utime(entry)  # Mark as recently used
+        except FileNotFoundError:
+            # Not generated yet, or evicted by another worker
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def _store(self, key, data):
+        path = self._dir()
+        if path is None:
+            return
+        path.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path, prefix=".", delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path / key)
+        self._evict(path)
+
+    def _evict(self, path):
+        entries = []
+        for entry in path.iterdir():
+            if entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+stream_cache = Stream_cache()
+
+
+#####
+# Provides a single place that determines how sub-frames are displayed. Takes a sample number and the subframe
+# and outputs that as a string for printing and checking against.
+#####
+def sub_frame_string(sample_no, subframe):
+    pre = subframe[:8]
+    pre = (
+        "Z"
+        if pre == PREAMBLE_Z
+        else "X"
+        if pre == PREAMBLE_X
+        else "Y"
+        if pre == PREAMBLE_Y
+        else pre
+    )
+    return f"{sample_no} [{pre}] - {subframe[9::2]} {subframe[8::2]}"
+
+
+# The same for a subframe word in the receiver's output format, which has no transitions to show
+def subframe_word_string(sample_no, word):
+    return f"{sample_no} [{extract_preamble(word)}] - {'{:028b}'.format(word >> 4)[::-1]} {TRANSITIONS_OK}"
+
+
+# The subframe words, in the receiver's output format, of an array of 64 cell transition histories that each start
+# with a preamble (oldest cell in the top bit, as kept by Spdif_rx), and whether each has a transition at the start
+# of every bit. These print the same as sub_frame_string() gives for the histories.
+def transition_words(histories):
+    histories = np.asarray(histories, dtype=np.uint64)
+    cells = (histories[:, None] >> np.arange(63, -1, -1, dtype=np.uint64)) & np.uint64(1)
+    data = cells[:, 9::2].astype(np.uint32) << np.arange(4, 32, dtype=np.uint32)
+    preamble = histories >> np.uint64(56)
+    preambles = np.select(
+        [preamble == int(pre, 2) for pre in (PREAMBLE_Z, PREAMBLE_X, PREAMBLE_Y)],
+        [FRAME_Z, FRAME_X, FRAME_Y],
+    ).astype(np.uint32)
+    return np.bitwise_or.reduce(data, axis=1) | preambles, cells[:, 8::2].all(axis=1)
+
+
+#####
+# Audio_func provides a class that can be given a type of test signal, fixed, ramp, none etc. and a control value
+# and output what the next sample value should be based off the previous sample value by calling .next(previous)
+#
+# The way the control value is used depends on the function type. Eg. ("ramp", 5) will output the previous value + 5
+# and ("fixed", 5) will output 5 no matter what the previous value is.
+#
+# .samples(initial, count, start=0) outputs the same sequence as an integer array, where sample 0 is initial, for
+# count samples from sample start. .block(initial, block_no) outputs one 192 sample block of it.
+#
+# The other types only have .samples(), .block() and .at(sample_nos), the values at an array of sample numbers, as
+# their values depend on the sample number rather than the previous value. Values are signed 24 bit, amplitudes
+# are a fraction of full scale:
+#     ("sine", freq_Hz, amplitude=1.0)     sine wave, sam_freq must be given to Audio_func
+#     ("noise", seed, amplitude=1.0)       uniform pseudo-random noise, the same for the same seed (0 to 2**64 - 1)
+#     ("square", freq_Hz)                  full scale square wave, at sam_freq / 2 every sample changes
+#     ("array", values)                    the values given, repeated
+#     ("wav", file_name, channel=0)        a channel of a PCM WAV file, scaled to 24 bits and repeated
+#####
+FULL_SCALE = (1 << 23) - 1
+
+
+class Audio_func:
+    def __init__(self, type="none", value=0, *params, sam_freq=None):
+        _type = type.lower()
+        if _type == "none":
+            self.next = self._none
+        elif _type == "fixed":
+            self.next = self._fixed
+        elif _type == "ramp":
+            self.next = self._ramp
+        elif _type in ["sine", "noise", "square", "array", "wav"]:
+            self.next = self._no_next
+        else:
+            raise Exception("Unsupported audio data type")
+        self._type = _type
+        self._value = value
+        self._params = params
+        self.absolute = _type not in ["none", "fixed", "ramp"]  # values depend on the sample number only
+        self._sam_freq = sam_freq
+        if _type in ["sine", "square"] and sam_freq is None:
+            raise Exception(f"Audio data type {_type} needs the sample rate")
+        if _type == "noise" and not 0 <= value < (1 << 64):
+            raise Exception(f"Noise seed {value} is not between 0 and 2**64 - 1")
+        if _type == "array":
+            self._values = np.asarray(value, dtype=np.int64)
+        elif _type == "wav":
+            self._values = _read_wav(value, params[0] if params else 0)
+
+    def _none(self, previous):
+        return None
+
+    def _fixed(self, previous):
+        return self._value
+
+    def _ramp(self, previous):
+        return (previous + self._value) if previous is not None else None
+
+    def _no_next(self, previous):
+        raise Exception(f"Audio data type {self._type} has no next value, use .samples()")
+
+    def _amplitude(self):
+        return self._params[0] if self._params else 1.0
+
+    def samples(self, initial, count, start=0):
+        n = np.arange(start, start + count, dtype=np.int64)
+        if self.absolute:
+            return self.at(n)
+        if self._type == "ramp":
+            return initial + self._value * n
+        # No signal is sent as silence
+        samples = np.full(count, self._value if self._type == "fixed" else 0, dtype=np.int64)
+        if start == 0:
+            samples[:1] = initial
+        return samples
+
+    def at(self, n):
+        n = np.asarray(n, dtype=np.int64)
+        if self._type == "sine":
+            phase = 2 * np.pi * self._value * n / self._sam_freq
+            return np.round(self._amplitude() * FULL_SCALE * np.sin(phase)).astype(np.int64)
+        if self._type == "noise":
+            # Hashing the sample number, rather than drawing in order, gives the same value for a sample
+            # whichever block it is generated in
+            values = _splitmix64(n.astype(np.uint64) ^ _splitmix64(np.uint64(self._value)))
+            values = (values >> np.uint64(40)).astype(np.int64) - (1 << 23)
+            return np.round(values * self._amplitude()).astype(np.int64)
+        if self._type == "square":
+            high = (n * self._value * 2 // self._sam_freq) % 2 == 0
+            return np.where(high, FULL_SCALE, -FULL_SCALE - 1)
+        if self._type in ["array", "wav"]:
+            return self._values[n % len(self._values)]
+        raise Exception(f"Audio data type {self._type} depends on the previous value, use .samples()")
+
+    def block(self, initial, block_no):
+        return self.samples(initial, 192, block_no * 192)
+
+    # Identifies the signal for Stream_cache, including the content of arrays and WAV files
+    def description(self):
+        if self._type in ["array", "wav"]:
+            return [self._type, hashlib.sha256(self._values.tobytes()).hexdigest()]
+        return [self._type, self._value, *self._params]
+
+
+def _splitmix64(x):
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def _read_wav(file_name, channel):
+    with wave.open(str(file_name), "rb") as f:
+        width = f.getsampwidth()
+        no_of_channels = f.getnchannels()
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype=np.uint8)
+    data = data.reshape(-1, no_of_channels, width)[:, channel, :].astype(np.int64)
+    # Little endian bytes, the most significant one signed (8 bit WAV files are unsigned)
+    top = data[:, -1] - 128 if width == 1 else data[:, -1].astype(np.int8)
+    values = top.astype(np.int64)
+    for i in range(width - 2, -1, -1):
+        values = (values << 8) | data[:, i]
+    shift = 24 - 8 * width
+    return values << shift if shift >= 0 else values >> -shift
+
+
+#####
+# Returns the clock frequency for outputting audio at different sample rates
+#####
+def freq_for_sample_rate(sam_freq: int):
+    freq_Hz = None
+    no_of_channels = 2
+    no_of_bits_per_sub_frame = 64  # 32 bits of data & 32 transitions
+    if sam_freq in [44100, 48000, 88200, 96000, 176400, 192000]:
+        freq_Hz = sam_freq * no_of_bits_per_sub_frame * no_of_channels
+    return freq_Hz
+
+
+#####
+# Stream_plan works out how many blocks of Frames to generate, and the quick_start_offset to pass to .stream(), for a
+# receiver test that checks no_of_samples samples from the first Z subframe the receiver outputs.
+#
+# The stream is played in a loop, so the samples checked must all come before the end of the stream (where a ramp
+# jumps back to its start). The receiver is expected to output its first sample lock_ns after the stream starts, as
+# measured by an earlier run, or after lock_budget_blocks blocks when it has not been measured. The stream is rotated
+# so that a Z subframe arrives just after that, rather than up to a block later, and is made long enough for the
+# samples checked plus spare_blocks, which allow for the receiver locking later than expected.
+#
+# With no measurement the plan is the original fixed one: 7 blocks starting at a Z subframe, for 193 samples.
+#####
+class Stream_plan:
+    def __init__(
+        self,
+        sam_freq: int,
+        no_of_samples: int,
+        lock_ns: int | None = None,
+        lock_budget_blocks: int = 4,
+        spare_blocks: int = 1,
+    ):
+        if lock_ns is None:
+            first_z = lock_budget_blocks * 192
+        else:
+            # Round up, plus a couple of samples for the time from lock to the sample being output
+            first_z = -(-lock_ns * sam_freq // 1000000000) + 2
+        start = (192 - first_z % 192) % 192  # sample within the block that the stream starts at
+        self.first_z = first_z  # stream sample at which the first Z after lock is expected
+        self.quick_start_offset = start * 2  # in subframes
+        self.no_of_blocks = -(-(start + first_z + no_of_samples) // 192) + spare_blocks
+
+    def __repr__(self):
+        return f"Stream_plan(no_of_blocks={self.no_of_blocks}, quick_start_offset={self.quick_start_offset})"
+
+
+# Number of blocks to generate to check no_of_samples samples against
+def blocks_for_samples(no_of_samples: int):
+    return -(-no_of_samples // 192)
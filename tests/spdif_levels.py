@@ -0,0 +1,121 @@
+# Copyright 2024 XMOS LIMITED.
+# This Software is subject to the terms of the XMOS Public Licence: Version 1.
+
+#####
+# Test levels, selected with the --level option in conftest.py. Each level runs more of the parametrizations of a
+# test than the one before it, from a quick smoke test to every parametrization.
+#
+# A test marked test_levels(spec=...) gives a rule for each level it runs at, usually from the LEVELS in its
+# test_params.json, eg.
+#
+#     "test_rx": {
+#         "default": {"values": {"config": ["xs3"]}, "equal": [["sam_freq", "sample_freq_estimate"]]},
+#         "nightly": {"pairwise": ["config", "sam_freq", "sample_freq_estimate"]},
+#         "exhaustive": {}
+#     }
+#
+# A level without a rule uses the rule of the nearest level below it, and the test is not run at levels below its
+# first rule. A rule selects the parametrizations that pass all of:
+#
+#     "values": {factor: [value, ...]}  the factor is one of the values
+#     "equal": [[factor, factor], ...]  the factors have the same value
+#     "differ": [[factor, factor], ...] the factors have different values
+#     "offsets": [[factor0, factor1, [offset, ...]], ...]
+#                                       factor1 is one of the offsets from factor0 in the sorted values of both,
+#                                       wrapping around, eg. an offset of 1 is the next sample rate up
+#
+# and then, with "pairwise": [factor, ...], only as many of them as are needed to still cover every pair of values
+# of those factors, see covering_array().
+#
+# The factors are the parameters of the test, or as given by the factors function of the marker, eg. the sample
+# rate of a Recorded_stream.
+#####
+
+import itertools
+
+LEVELS = ["smoke", "default", "nightly", "exhaustive"]
+DEFAULT_LEVEL = "default"
+
+
+# The rule for the level, or None if the test is not run at that level
+def level_rule(spec, level):
+    for name in reversed(LEVELS[: LEVELS.index(level) + 1]):
+        if name in spec:
+            return spec[name]
+    return None
+
+
+def _matches(factors, rule, domains):
+    for name, values in rule.get("values", {}).items():
+        if factors[name] not in values:
+            return False
+    for name0, name1 in rule.get("equal", []):
+        if factors[name0] != factors[name1]:
+            return False
+    for name0, name1 in rule.get("differ", []):
+        if factors[name0] == factors[name1]:
+            return False
+    for name0, name1, offsets in rule.get("offsets", []):
+        domain = domains[(name0, name1)]
+        offset = domain.index(factors[name1]) - domain.index(factors[name0])
+        if offset % len(domain) not in [o % len(domain) for o in offsets]:
+            return False
+    return True
+
+
+#####
+# The indices of the combinations of factors (dicts of factor name to value) selected by the rule, in order
+#####
+def select(combinations, rule):
+    if rule is None:
+        return []
+    domains = {
+        (name0, name1): sorted({c[name0] for c in combinations} | {c[name1] for c in combinations})
+        for name0, name1, _ in rule.get("offsets", [])
+    }
+    selected = [idx for idx, factors in enumerate(combinations) if _matches(factors, rule, domains)]
+    if "pairwise" in rule:
+        covering = covering_array([combinations[idx] for idx in selected], rule["pairwise"])
+        selected = [selected[idx] for idx in covering]
+    return selected
+
+
+def _pairs(factors, names):
+    if len(names) == 1:
+        return {((names[0], factors[names[0]]),)}
+    return {
+        ((name0, factors[name0]), (name1, factors[name1])) for name0, name1 in itertools.combinations(names, 2)
+    }
+
+
+#####
+# A covering array: the indices of a subset of the combinations that between them include every pair of values of
+# the named factors that any of the combinations include. The combinations are chosen greedily, each time taking
+# the one that covers the most pairs not yet covered, so the subset is small although not always the smallest
+# possible. The greedy choice is repeated with ties going to the first combination from each starting point in
+# turn, and the smallest subset found is kept, so the same subset is chosen every time.
+#####
+def covering_array(combinations, names):
+    pairs = [_pairs(factors, names) for factors in combinations]
+    best = None
+    for start in range(len(combinations)):
+        order = [(start + i) % len(combinations) for i in range(len(combinations))]
+        chosen = _greedy_cover(pairs, order)
+        if best is None or len(chosen) < len(best):
+            best = chosen
+    return sorted(best) if best else []
+
+
+def _greedy_cover(pairs, order):
+    uncovered = set().union(*pairs)
+    chosen = []
+    while uncovered:
+        idx = max(order, key=lambda idx: len(pairs[idx] & uncovered))
+        chosen.append(idx)
+        uncovered -= pairs[idx]
+    # Drop any combination, latest first, whose pairs are all covered by the others
+    for idx in reversed(list(chosen)):
+        others = set().union(*(pairs[other] for other in chosen if other != idx))
+        if pairs[idx] <= others:
+            chosen.remove(idx)
+    return chosen
@@ -0,0 +1,745 @@
+# Copyright 2024 XMOS LIMITED.
+# This Software is subject to the terms of the XMOS Public Licence: Version 1.
+
+#####
+# Tools for oversampled S/PDIF stream files, as recorded by rx_capture and played back by
+# Spdif_tx. These only need NumPy so can be used without Pyxsim, eg.
+#
+#     python spdif_streams.py decode test_rx/streams/44100-coax.rle
+#     python spdif_streams.py expand test_rx/streams/44100-coax.rle 44100-coax.stream
+#     python spdif_streams.py synth 48000-jitter.rle --sam-freq 48000 --rj-ns 1 --dcd-ns 3
+#
+# A raw stream file holds the level of the S/PDIF signal sampled at a fixed rate (100 MHz for the
+# recorded streams), one bit per sample, least significant bit of each byte first. Compact stream
+# files (see below) hold the same signal as run lengths.
+#####
+
+import argparse
+import json
+import struct
+import zlib
+from pathlib import Path
+import numpy as np
+from spdif_frames import FRAME_X, FRAME_Y, FRAME_Z, PREAMBLE_MASK, Frames, extract_preamble, freq_for_sample_rate
+
+MHz = 1000000
+DEFAULT_SAMPLE_RATE = 100 * MHz
+
+# Pulse widths, in UI, of the first four pulses of each preamble
+_PREAMBLE_PULSES = {
+    FRAME_Z: (3, 1, 1, 3),
+    FRAME_X: (3, 3, 1, 1),
+    FRAME_Y: (3, 2, 1, 2),
+}
+
+
+def stream_bits(data):
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder="little")
+
+
+_POWERS_OF_10 = 10 ** np.arange(19, dtype=np.uint64)
+
+
+#####
+# Parses whitespace separated unsigned decimal integers, such as the one value per line output by
+# rx_capture, into an array without a Python call per value. Integers of more than 19 digits, which
+# may not fit in 64 bits, are rejected.
+#####
+def parse_uints(text: bytes):
+    chars = np.frombuffer(text, dtype=np.uint8)
+    digits = np.flatnonzero((chars >= ord("0")) & (chars <= ord("9")))
+    if len(digits) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    first = np.ones(len(digits), dtype=bool)
+    first[1:] = digits[1:] != digits[:-1] + 1
+    starts = np.flatnonzero(first)
+    ends = np.append(starts[1:], len(digits))
+    if (ends - starts).max() > len(_POWERS_OF_10):
+        raise Exception(f"Integer of more than {len(_POWERS_OF_10)} digits in the input")
+    place = ends[np.cumsum(first) - 1] - np.arange(len(digits)) - 1
+    values = (chars[digits] - ord("0")).astype(np.uint64) * _POWERS_OF_10[place]
+    return np.add.reduceat(values, starts)
+
+
+#####
+# Compact stream files hold the same signal as a stream file as the lengths of the runs between
+# level changes, which for S/PDIF are only 1 to 3 UI, so are several times smaller:
+#
+#     8 bytes   "SPDIFRLE"
+#     4 bytes   length of the header (little endian)
+#     header    JSON object: version, sam_freq (audio sample rate, or null), capture_clock
+#               (sample rate of the stream in Hz), polarity (level of the first sample), source
+#     payload   zlib compressed run lengths, one byte each. Runs of 255 samples or more are
+#               split into bytes of 255 followed by a byte of the remainder (which may be 0).
+#
+# The final run is ended by the end of the stream rather than a level change.
+#####
+COMPACT_MAGIC = b"SPDIFRLE"
+COMPACT_VERSION = 1
+
+
+def encode_runs(runs):
+    runs = np.asarray(runs, dtype=np.int64)
+    full, remainder = np.divmod(runs, 255)
+    codes = np.full(int(full.sum() + len(runs)), 255, dtype=np.uint8)
+    codes[np.cumsum(full + 1) - 1] = remainder
+    return codes
+
+
+#####
+# Writes a compact stream file from bits (sample levels) supplied in any number of chunks
+#####
+class Compact_stream_writer:
+    def __init__(self, f, capture_clock=DEFAULT_SAMPLE_RATE, sam_freq=None, source=""):
+        self._f = f
+        self._header = {
+            "version": COMPACT_VERSION,
+            "sam_freq": sam_freq,
+            "capture_clock": capture_clock,
+            "polarity": None,
+            "source": source,
+        }
+        self._compressor = zlib.compressobj()
+        self._level = None
+        self._run = 0
+        self.bytes_written = 0
+
+    def _write(self, data):
+        self._f.write(data)
+        self.bytes_written += len(data)
+
+    def write_bits(self, bits):
+        if len(bits) == 0:
+            return
+        if self._level is None:
+            self._level = int(bits[0])
+            self._header["polarity"] = self._level
+            header = json.dumps(self._header).encode()
+            self._write(COMPACT_MAGIC + struct.pack("<I", len(header)) + header)
+        changes = np.flatnonzero(bits[1:] != bits[:-1]) + 1
+        if bits[0] != self._level:
+            changes = np.concatenate(([0], changes))
+        if len(changes):
+            runs = np.diff(changes, prepend=0)
+            runs[0] += self._run
+            self._write(self._compressor.compress(encode_runs(runs).tobytes()))
+            self._run = len(bits) - int(changes[-1])
+        else:
+            self._run += len(bits)
+        self._level = int(bits[-1])
+
+    def close(self):
+        if self._level is not None:
+            self._write(self._compressor.compress(encode_runs([self._run]).tobytes()))
+            self._write(self._compressor.flush())
+
+
+def decode_runs(codes):
+    codes = np.asarray(codes, dtype=np.uint8)
+    run = np.zeros(len(codes), dtype=np.int64)
+    run[1:] = np.cumsum(codes[:-1] != 255)
+    return np.bincount(run, weights=codes).astype(np.int64)
+
+
+#####
+# A stream held as run lengths, as read from a compact stream file. Spdif_tx can play these back
+# directly from their edges, without expanding them to one bit per sample.
+#####
+class Compact_stream:
+    def __init__(self, runs, polarity=0, capture_clock=DEFAULT_SAMPLE_RATE, sam_freq=None, source=""):
+        self.runs = np.asarray(runs, dtype=np.int64)
+        self.polarity = polarity
+        self.capture_clock = capture_clock
+        self.sam_freq = sam_freq
+        self.source = source
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[: len(COMPACT_MAGIC)] != COMPACT_MAGIC:
+            raise Exception("Not a compact stream file")
+        (header_len,) = struct.unpack_from("<I", data, len(COMPACT_MAGIC))
+        payload = len(COMPACT_MAGIC) + 4 + header_len
+        header = json.loads(data[len(COMPACT_MAGIC) + 4 : payload])
+        if header["version"] > COMPACT_VERSION:
+            raise Exception(
+                f"Unsupported compact stream version {header['version']}, if input is correct please add support"
+            )
+        return cls(
+            decode_runs(np.frombuffer(zlib.decompress(data[payload:]), dtype=np.uint8)),
+            header["polarity"],
+            header["capture_clock"],
+            header["sam_freq"],
+            header["source"],
+        )
+
+    @classmethod
+    def from_stream(cls, data, capture_clock=DEFAULT_SAMPLE_RATE, sam_freq=None, source=""):
+        bits = stream_bits(data)
+        starts = np.concatenate(([0], np.flatnonzero(bits[1:] != bits[:-1]) + 1))
+        return cls(
+            np.diff(np.append(starts, len(bits))),
+            int(bits[0]) if len(bits) else 0,
+            capture_clock,
+            sam_freq,
+            source,
+        )
+
+    def __len__(self):
+        # Number of samples
+        return int(self.runs.sum())
+
+    def edges(self):
+        # Sample index at which each run starts
+        return np.concatenate(([0], np.cumsum(self.runs)[:-1]))
+
+    def levels(self):
+        return (np.arange(len(self.runs)) + self.polarity) % 2
+
+    def bits(self):
+        return np.repeat(self.levels().astype(np.uint8), self.runs)
+
+    def to_stream(self):
+        # The last byte is padded with the final level
+        bits = self.bits()
+        padding = -len(bits) % 8
+        if padding:
+            bits = np.append(bits, np.full(padding, bits[-1], dtype=np.uint8))
+        return np.packbits(bits, bitorder="little").tobytes()
+
+    def to_bytes(self):
+        header = json.dumps(
+            {
+                "version": COMPACT_VERSION,
+                "sam_freq": self.sam_freq,
+                "capture_clock": self.capture_clock,
+                "polarity": self.polarity,
+                "source": self.source,
+            }
+        ).encode()
+        return (
+            COMPACT_MAGIC
+            + struct.pack("<I", len(header))
+            + header
+            + zlib.compress(encode_runs(self.runs).tobytes())
+        )
+
+
+#####
+# Loads a stream file, returning a Compact_stream for compact files and the raw bytes otherwise.
+# Either can be given to Spdif_tx_stream or decode_stream().
+#####
+def load_stream_file(file_name):
+    data = Path(file_name).read_bytes()
+    if data.startswith(COMPACT_MAGIC):
+        return Compact_stream.from_bytes(data)
+    return data
+
+
+#####
+# Recorded_stream hold metadata about a bit stream representation of spdif data
+#
+# .load(stream_dir) reads the file, either a raw or compact stream file, ready for Spdif_tx_stream
+#####
+class Recorded_stream:
+    def __init__(self, file_name, audio, sam_freq, sample_rate):
+        self.file_name = (
+            file_name  # the raw or compact stream file to be interpreted as an spdif signal
+        )
+        self.audio = audio  # Audio_func() describing the expected signal
+        self.sam_freq = sam_freq  # audio sample rate
+        self.sample_rate = sample_rate  # signal sample rate
+
+    def load(self, stream_dir):
+        return load_stream_file(Path(stream_dir) / self.file_name)
+
+
+# Number of edges the phase of the UI clock is averaged over when the UI cells are recovered
+_PHASE_BLOCK = 16
+
+
+def _cell_transitions(edges):
+    # Returns whether each UI cell, counted from the one the first edge starts, starts with a transition, and the
+    # length of a UI in samples.
+    #
+    # High and low pulses alternate, so the sum of each pair of pulses is free of duty-cycle distortion. Most pairs
+    # are two 1 UI pulses, so the UI starts from a low percentile of the pair widths and is refined using every
+    # pulse that rounds to a valid biphase-mark width of 1, 2 or 3 UI. Jitter moves the edges by too much for each
+    # pulse to be rounded to a whole number of UI on its own, so the cells are recovered from the time of the edges
+    # instead, against the phase of the UI clock averaged over blocks of _PHASE_BLOCK edges and interpolated between
+    # them, which also follows any drift left in the UI. The duty-cycle distortion is measured separately for the
+    # edges starting each pulse level and removed from the phase.
+    #
+    # The level of each cell is then the level the line is at for most of it, so glitches shorter than half a UI
+    # are ignored as a receiver sampling the middle of each cell would.
+    widths = np.diff(edges)
+    pairs = widths[:-1] + widths[1:]
+    ui = float(np.percentile(pairs, 10)) / 2
+    for _ in range(2):
+        units = np.rint(widths / ui)
+        valid = (units >= 1) & (units <= 3)
+        ui = widths[valid].sum() / units[valid].sum()
+
+    times = (edges - edges[0]) / ui
+    level = np.arange(len(times)) % 2
+    # The phasors of the edges starting each pulse level are summed over each block separately, so the duty-cycle
+    # distortion can be removed from the sums by rotating them
+    angles = (2 * np.pi * (times - np.floor(times))).astype(np.float32)
+    phasors = np.zeros(len(times) + -len(times) % _PHASE_BLOCK, dtype=np.complex64)
+    phasors.real[: len(times)] = np.cos(angles)
+    phasors.imag[: len(times)] = np.sin(angles)
+    level_sums = phasors.reshape(-1, _PHASE_BLOCK // 2, 2).sum(axis=1)
+    centres = np.minimum(np.arange(len(level_sums)) * _PHASE_BLOCK + _PHASE_BLOCK // 2, len(times) - 1)
+    offsets = np.zeros(2)
+    for _ in range(2):
+        block_phase = np.unwrap(np.angle(level_sums @ np.exp(-2j * np.pi * offsets))) / (2 * np.pi)
+        corrected = times - offsets[level]
+        phase = np.interp(np.arange(len(times)), centres, block_phase)
+        cells = np.rint(corrected - phase)
+        residual = corrected - cells - phase
+        offsets += [residual[0::2].mean(), residual[1::2].mean()]
+        offsets -= offsets.mean()
+
+    # Cell n starts at n + phase; the time the line is high up to each cell boundary gives the level of each cell.
+    # Every edge is within half a UI of the start of its cell, so the edges before each boundary are those in the
+    # cells before it and those in its own cell that are early.
+    # The line stays at its last level through the cell after the last edge.
+    cells = cells.astype(np.int64) - int(cells[0])
+    cell_no = np.arange(cells[-1] + 2)
+    bounds = cell_no + np.interp(cell_no, cells[centres], phase[centres])
+    early = times <= bounds[cells]
+    in_cell = np.bincount(cells, minlength=len(cell_no))
+    before = np.concatenate(([0], np.cumsum(in_cell)))[:-1] + np.bincount(cells, early, len(cell_no))
+    prev = np.maximum(before.astype(np.int64) - 1, 0)
+    high = 1 - level
+    high_time = np.concatenate(([0], np.cumsum(np.diff(times) * high[:-1])))
+    high_time = high_time[prev] + np.maximum(bounds - times[prev], 0) * high[prev]
+    levels = np.diff(high_time) > np.diff(bounds) / 2
+    transitions = np.concatenate(([1], levels[1:] != levels[:-1])).astype(np.uint8)
+    if cells[-1] > 0:
+        ui = (edges[-1] - edges[0]) / cells[-1]
+    return transitions, ui
+
+
+#####
+# The result of decoding a stream. Subframes are held as 32-bit words in the same layout as the
+# receiver outputs them so they can be compared directly with Frames.words().
+#
+# .words            receiver format word for every complete subframe found
+# .coding_errors    True for subframes with a missing clock transition or not 64 UI after the
+#                   previous subframe
+# .ui               length of one UI (half a bit cell) in samples
+# .channels()       per-channel audio, validity, user, channel status and parity error arrays
+# .channel_status_blocks(channel)
+#                   the 24 byte channel status of each complete block
+#####
+class Decoded_stream:
+    def __init__(self, words, coding_errors, ui, sample_rate):
+        self.words = words
+        self.coding_errors = coding_errors
+        self.ui = ui
+        self.sample_rate = sample_rate
+
+    @property
+    def sam_freq_estimate(self):
+        return self.sample_rate / (self.ui * 128)
+
+    def _first_frame(self):
+        # Index of the first subframe that starts a frame
+        starts = np.flatnonzero((self.words & PREAMBLE_MASK) != FRAME_Y)
+        return int(starts[0]) if len(starts) else len(self.words)
+
+    def channels(self, no_of_channels=2):
+        words = self.words[self._first_frame():]
+        words = words[: len(words) - len(words) % no_of_channels]
+        channels = []
+        for i in range(no_of_channels):
+            chan = words[i::no_of_channels]
+            data = chan >> 4
+            parity = data.copy()
+            for shift in (16, 8, 4, 2, 1):
+                parity ^= parity >> shift
+            channels.append(
+                Decoded_channel(
+                    audio=(data & 0xFFFFFF).astype(np.int32) << 8 >> 8,
+                    validity=(data >> 24) & 1,
+                    user=(data >> 25) & 1,
+                    channel_status=(data >> 26) & 1,
+                    parity_error=(parity & 1).astype(bool),
+                    block_start=(words[::no_of_channels] & PREAMBLE_MASK) == FRAME_Z,
+                )
+            )
+        return channels
+
+    def channel_status_blocks(self, channel=0):
+        chan = self.channels()[channel]
+        starts = np.flatnonzero(chan.block_start)
+        starts = starts[starts + 192 <= len(chan.channel_status)]
+        bits = chan.channel_status[starts[:, None] + np.arange(192)].astype(np.uint8)
+        return np.packbits(bits, axis=1, bitorder="little")
+
+    def summary(self):
+        lines = [
+            f"UI: {self.ui:.3f} samples ({self.sam_freq_estimate:.0f} Hz from UI)",
+            f"Subframes: {len(self.words)} ({np.count_nonzero(self.coding_errors)} with coding errors)",
+        ]
+        if len(self.words):
+            counts = {
+                pre: int(np.count_nonzero((self.words & PREAMBLE_MASK) == code))
+                for pre, code in (("Z", FRAME_Z), ("X", FRAME_X), ("Y", FRAME_Y))
+            }
+            lines.append(f"Preambles: {counts}")
+        for i, chan in enumerate(self.channels()):
+            steps, counts = np.unique(np.diff(chan.audio), return_counts=True)
+            lines.append(
+                f"Channel {i}: {len(chan.audio)} samples, {np.count_nonzero(chan.parity_error)} parity errors, "
+                f"{np.count_nonzero(chan.validity)} invalid, most common step {steps[np.argmax(counts)] if len(steps) else '-'}"
+            )
+        blocks = self.channel_status_blocks()
+        if len(blocks):
+            lines.append(f"Channel status: {bytes(blocks[0]).hex(' ')}")
+            freq = channel_status_sam_freq(blocks[0])
+            lines.append(f"Sample rate from channel status: {freq if freq else 'unknown'}")
+        return "\n".join(lines)
+
+
+#####
+# Container for the decoded content of one channel, one entry per frame
+#####
+class Decoded_channel:
+    def __init__(self, audio, validity, user, channel_status, parity_error, block_start):
+        self.audio = audio  # signed 24-bit samples
+        self.validity = validity
+        self.user = user
+        self.channel_status = channel_status
+        self.parity_error = parity_error
+        self.block_start = block_start  # frames with a Z preamble
+
+
+#####
+# Returns the sample rate coded in byte 3 of a channel status block (as written by Frames)
+#####
+def channel_status_sam_freq(channel_status):
+    codes = {
+        0b0100: 22050,
+        0b0000: 44100,
+        0b1000: 88200,
+        0b1100: 176400,
+        0b0110: 24000,
+        0b0010: 48000,
+        0b1010: 96000,
+        0b1110: 192000,
+    }
+    return codes.get(int(channel_status[3]) & 0xF)
+
+
+#####
+# Decodes an oversampled stream, recovering the UI cells from the level changes and finding the
+# cells that start with a transition (see _cell_transitions()), locating the preambles from the widths in UI of their first four pulses and reading
+# the data bits from the UI cells that follow.
+#####
+def decode_stream(data, sample_rate=DEFAULT_SAMPLE_RATE):
+    if isinstance(data, Compact_stream):
+        edges = data.edges()[1:]
+    else:
+        bits = stream_bits(data)
+        edges = np.flatnonzero(bits[1:] != bits[:-1]) + 1
+    empty = Decoded_stream(np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=bool), float("nan"), sample_rate)
+    if len(edges) < 9:
+        return empty
+    transitions, ui = _cell_transitions(edges)
+
+    # cells[i] is the UI cell that pulse i starts in, and units[i] its width in UI
+    cells = np.flatnonzero(transitions)
+    units = np.diff(cells)
+    if len(units) < 8:
+        return empty
+
+    preambles = np.full(len(units), -1)
+    for code, pulses in _PREAMBLE_PULSES.items():
+        match = np.ones(len(units) - 3, dtype=bool)
+        for i, width in enumerate(pulses):
+            match &= units[i:len(units) - 3 + i] == width
+        preambles[:len(units) - 3][match] = code
+    found = np.flatnonzero(preambles >= 0)
+    starts = cells[found]
+    complete = starts + 64 <= len(transitions)
+    found, starts = found[complete], starts[complete]
+
+    data_cells = transitions[starts[:, None] + 9 + 2 * np.arange(28)]
+    clock_cells = transitions[starts[:, None] + 8 + 2 * np.arange(28)]
+    words = (data_cells.astype(np.uint32) << np.arange(4, 32, dtype=np.uint32)).sum(
+        axis=1, dtype=np.uint32
+    )
+    words |= preambles[found].astype(np.uint32)
+    coding_errors = ~clock_cells.all(axis=1)
+    coding_errors[1:] |= np.diff(starts) != 64
+    return Decoded_stream(words, coding_errors, ui, sample_rate)
+
+
+def decode_file(file_name, sample_rate=DEFAULT_SAMPLE_RATE):
+    return decode_stream(load_stream_file(file_name), sample_rate)
+
+
+#####
+# Renders the S/PDIF signal given as UI cell levels (as from Frames.stream()) as an oversampled stream,
+# sampled at sample_rate like the recorded streams, with impairments to the timing of its edges:
+#
+#     ppm       offset of the UI rate from freq_for_sample_rate(sam_freq), in parts per million
+#     rj_ns     random jitter, the standard deviation of a normal distribution
+#     sj_ns     sinusoidal jitter amplitude, at sj_freq Hz with a random phase
+#     dcd_ns    duty-cycle distortion, high pulses are this much longer and low pulses this much shorter
+#     rise_ns   rise and fall time. Samples taken during an edge read the new level with a probability
+#               that rises linearly through the edge, so slow edges chatter as noise on them would.
+#
+# The random impairments are drawn from seed, so the same arguments always give the same stream.
+# Edges are not reordered, so the jitter should be well under a UI. The result is a Compact_stream,
+# which Spdif_tx plays back directly and which can be saved with to_bytes() or to_stream().
+#####
+def synthesize_stream(
+    data,
+    sam_freq,
+    sample_rate=DEFAULT_SAMPLE_RATE,
+    ppm=0,
+    rj_ns=0,
+    sj_ns=0,
+    sj_freq=0,
+    dcd_ns=0,
+    rise_ns=0,
+    seed=0,
+):
+    levels = stream_bits(data)
+    ui_ns = 1e9 / (freq_for_sample_rate(sam_freq) * (1 + ppm * 1e-6))
+    sample_ns = 1e9 / sample_rate
+    if rise_ns >= ui_ns:
+        raise Exception(f"Rise time {rise_ns} ns must be less than a UI ({ui_ns:.1f} ns)")
+    rng = np.random.default_rng(seed)
+
+    cells = np.flatnonzero(levels[1:] != levels[:-1]) + 1
+    new_levels = levels[cells].astype(np.int8)
+    times = cells * ui_ns
+    if sj_ns:
+        times += sj_ns * np.sin(2 * np.pi * sj_freq * 1e-9 * times + rng.uniform(0, 2 * np.pi))
+    if rj_ns:
+        times += rng.normal(0, rj_ns, len(times))
+    times += np.where(new_levels == 1, -dcd_ns / 2, dcd_ns / 2)
+
+    # Each edge is a run of samples through the edge followed by the first sample at the new level
+    window = int(np.ceil(rise_ns / sample_ns))
+    starts = np.ceil((times - rise_ns / 2) / sample_ns).astype(np.int64)
+    positions = starts[:, None] + np.arange(window + 1)
+    through = np.clip((positions[:, :window] * sample_ns - (times[:, None] - rise_ns / 2)) / max(rise_ns, 1e-9), 0, 1)
+    at_new_level = np.concatenate(
+        (rng.random(through.shape) < through, np.ones((len(times), 1), dtype=bool)), axis=1
+    )
+    values = np.where(at_new_level, new_levels[:, None], 1 - new_levels[:, None]).ravel()
+    positions = np.maximum(positions.ravel(), 0)
+
+    # Where the jitter has moved samples of neighbouring edges together the later one wins
+    order = np.argsort(positions, kind="stable")
+    positions, values = positions[order], values[order]
+    last = np.append(positions[1:] != positions[:-1], True)
+    positions, values = positions[last], values[last]
+    changes = np.flatnonzero(values != np.concatenate(([levels[0]], values[:-1])))
+
+    no_of_samples = max(int(np.ceil(len(levels) * ui_ns / sample_ns)), int(positions[-1]) + 1 if len(positions) else 1)
+    runs = np.diff(np.concatenate(([0], positions[changes], [no_of_samples])))
+    source = (
+        f"synthesized ppm={ppm} rj_ns={rj_ns} sj_ns={sj_ns} sj_freq={sj_freq} dcd_ns={dcd_ns} "
+        f"rise_ns={rise_ns} seed={seed}"
+    )
+    # A change at the very first sample makes an empty first run
+    if len(runs) > 1 and runs[0] == 0:
+        return Compact_stream(runs[1:], 1 - int(levels[0]), sample_rate, sam_freq, source)
+    return Compact_stream(runs, int(levels[0]), sample_rate, sam_freq, source)
+
+
+#####
+# Timing of the edges of an S/PDIF signal, given the time of each edge and the nominal length of a
+# UI in the same units (eg. ns). Edges before the first preamble are ignored.
+#
+# Each pulse is classified as 1, 2 or 3 UI using the nominal UI. The UI of the signal is measured
+# by fitting a straight line to the edge times against their UI cell, so a signal that is slow or
+# fast as a whole (eg. from the master clock) shows as drift rather than jitter.
+#
+# .units                width of each pulse in UI
+# .ui                   measured length of a UI
+# .drift_ppm            difference of the measured UI from the nominal UI, in ppm
+# .interval_deviation   difference of each pulse from its width in measured UI
+# .time_deviation       difference of each edge from the fitted line (time interval error)
+# .subframe_periods     time between the starts of subframes that are 64 UI apart
+# .misaligned_subframes number of subframes not starting 64 UI after the previous one
+# .histograms(bin_size) counts of .interval_deviation in bins of bin_size, for each pulse width
+#####
+class Edge_timing:
+    def __init__(self, times, nominal_ui):
+        self.nominal_ui = nominal_ui
+        times = np.asarray(times, dtype=np.float64)
+        widths = np.diff(times)
+        units = np.clip(np.rint(widths / nominal_ui).astype(np.int64), 1, 4)
+
+        match = np.ones(max(len(units) - 3, 0), dtype=bool)
+        starts = np.zeros(0, dtype=np.int64)
+        for pulses in _PREAMBLE_PULSES.values():
+            found = match.copy()
+            for i, width in enumerate(pulses):
+                found &= units[i : len(units) - 3 + i] == width
+            starts = np.union1d(starts, np.flatnonzero(found))
+        first = int(starts[0]) if len(starts) else len(units)
+
+        self.times = times[first:]
+        self.units = units[first:]
+        widths = widths[first:]
+        # UI cell of each edge
+        cells = np.concatenate(([0], np.cumsum(self.units)))
+        self.invalid = self.units > 3
+
+        if len(self.units) >= 2:
+            self.ui, offset = np.polyfit(cells, self.times, 1)
+            self.time_deviation = self.times - (offset + cells * self.ui)
+        else:
+            self.ui = float(nominal_ui)
+            self.time_deviation = np.zeros(len(self.times))
+        self.drift_ppm = (self.ui / nominal_ui - 1) * 1e6
+        self.interval_deviation = widths - self.units * self.ui
+
+        # Edges that start a preamble
+        starts = starts[starts >= first] - first
+        periods = np.diff(self.times[starts])
+        aligned = np.diff(cells[starts]) == 64
+        self.subframe_periods = periods[aligned]
+        self.misaligned_subframes = int(np.count_nonzero(~aligned))
+
+    def histograms(self, bin_size):
+        histograms = {}
+        for width in (1, 2, 3):
+            bins, counts = np.unique(
+                np.rint(self.interval_deviation[self.units == width] / bin_size).astype(np.int64),
+                return_counts=True,
+            )
+            histograms[width] = {
+                int(b) * bin_size: int(count) for b, count in zip(bins.tolist(), counts.tolist())
+            }
+        return histograms
+
+    # Worst differences from the measured timing, in UI
+    def max_interval_deviation(self):
+        valid = self.interval_deviation[~self.invalid]
+        return float(np.abs(valid).max()) / self.ui if len(valid) else 0.0
+
+    def max_time_deviation(self):
+        return float(np.abs(self.time_deviation).max()) / self.ui if len(self.time_deviation) else 0.0
+
+    def subframe_drift_ppm(self):
+        return (self.subframe_periods / (64 * self.nominal_ui) - 1) * 1e6
+
+    def summary(self, bin_size):
+        drift = self.subframe_drift_ppm()
+        return {
+            "edges": len(self.times),
+            "invalid_pulses": int(np.count_nonzero(self.invalid)),
+            "misaligned_subframes": self.misaligned_subframes,
+            "ui": float(self.ui),
+            "drift_ppm": float(self.drift_ppm),
+            "subframe_drift_ppm": (
+                {"min": float(drift.min()), "max": float(drift.max()), "mean": float(drift.mean())}
+                if len(drift)
+                else None
+            ),
+            "max_interval_deviation_ui": self.max_interval_deviation(),
+            "max_time_deviation_ui": self.max_time_deviation(),
+            "histograms": self.histograms(bin_size),
+        }
+
+
+def _decode_cmd(args):
+    decoded = decode_file(args.in_file, args.sample_rate)
+    print(decoded.summary())
+    if args.frames:
+        for i, word in enumerate(decoded.words[: args.frames].tolist()):
+            error = " coding error" if decoded.coding_errors[i] else ""
+            print(f"{i} [{extract_preamble(word)}] - {'{:028b}'.format(word >> 4)[::-1]}{error}")
+
+
+def _compact_cmd(args):
+    data = load_stream_file(args.in_file)
+    if isinstance(data, Compact_stream):
+        print(f"Error: input file {args.in_file} is already a compact stream file")
+        return
+    compact = Compact_stream.from_stream(data, args.sample_rate, args.sam_freq, args.source)
+    out = compact.to_bytes()
+    Path(args.out_file).write_bytes(out)
+    print(f"{len(compact.runs)} runs, {len(data)} bytes to {len(out)} bytes")
+
+
+def _expand_cmd(args):
+    data = load_stream_file(args.in_file)
+    if not isinstance(data, Compact_stream):
+        print(f"Error: input file {args.in_file} is not a compact stream file")
+        return
+    Path(args.out_file).write_bytes(data.to_stream())
+
+
+def _synth_cmd(args):
+    frames = Frames(
+        channels=[["ramp", 5], ["ramp", -7]], no_of_blocks=args.blocks, sam_freq=args.sam_freq
+    )
+    data = synthesize_stream(
+        frames.stream(),
+        args.sam_freq,
+        args.sample_rate,
+        ppm=args.ppm,
+        rj_ns=args.rj_ns,
+        sj_ns=args.sj_ns,
+        sj_freq=args.sj_freq,
+        dcd_ns=args.dcd_ns,
+        rise_ns=args.rise_ns,
+        seed=args.seed,
+    )
+    Path(args.out_file).write_bytes(data.to_bytes())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tools for oversampled S/PDIF stream files")
+    commands = parser.add_subparsers(required=True)
+
+    decode = commands.add_parser("decode", help="Decode a stream file and print a summary of its content")
+    decode.add_argument("in_file", help="Path to the stream file")
+    decode.add_argument("--sample-rate", type=int, default=DEFAULT_SAMPLE_RATE, help="Rate the stream was sampled at in Hz")
+    decode.add_argument("--frames", type=int, default=0, help="Number of decoded subframes to print")
+    decode.set_defaults(func=_decode_cmd)
+
+    compact = commands.add_parser("compact", help="Convert a raw stream file to a compact stream file")
+    compact.add_argument("in_file", help="Path to the raw stream file")
+    compact.add_argument("out_file", help="Path to the compact stream file to create")
+    compact.add_argument("--sample-rate", type=int, default=DEFAULT_SAMPLE_RATE, help="Rate the stream was sampled at in Hz")
+    compact.add_argument("--sam-freq", type=int, help="Audio sample rate of the stream")
+    compact.add_argument("--source", default="", help="Description of the source of the stream")
+    compact.set_defaults(func=_compact_cmd)
+
+    expand = commands.add_parser("expand", help="Convert a compact stream file to a raw stream file")
+    expand.add_argument("in_file", help="Path to the compact stream file")
+    expand.add_argument("out_file", help="Path to the raw stream file to create")
+    expand.set_defaults(func=_expand_cmd)
+
+    synth = commands.add_parser(
+        "synth", help="Write a compact stream file of ramps like the recorded streams, with the given impairments"
+    )
+    synth.add_argument("out_file", help="Path to the compact stream file to create")
+    synth.add_argument("--sam-freq", type=int, default=48000, help="Audio sample rate of the stream")
+    synth.add_argument("--blocks", type=int, default=10, help="Number of 192 sample blocks")
+    synth.add_argument("--sample-rate", type=int, default=DEFAULT_SAMPLE_RATE, help="Rate to sample the stream at in Hz")
+    synth.add_argument("--ppm", type=float, default=0, help="Offset of the UI rate in parts per million")
+    synth.add_argument("--rj-ns", type=float, default=0, help="Random jitter (standard deviation) in ns")
+    synth.add_argument("--sj-ns", type=float, default=0, help="Sinusoidal jitter amplitude in ns")
+    synth.add_argument("--sj-freq", type=float, default=0, help="Sinusoidal jitter frequency in Hz")
+    synth.add_argument("--dcd-ns", type=float, default=0, help="Duty-cycle distortion in ns")
+    synth.add_argument("--rise-ns", type=float, default=0, help="Rise and fall time in ns")
+    synth.add_argument("--seed", type=int, default=0, help="Seed for the random impairments")
+    synth.set_defaults(func=_synth_cmd)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,81 @@
 # Copyright 2014-2024 XMOS LIMITED.
 # This Software is subject to the terms of the XMOS Public Licence: Version 1.
 
-from Pyxsim import SimThread
+import hashlib
+import json
 import os
+import types
+from array import array
+from pathlib import Path
+import numpy as np
+import Pyxsim
+from Pyxsim import SimThread
+from spdif_frames import (  # noqa: F401 re-exported for the tests
+    PREAMBLE_Z,
+    PREAMBLE_X,
+    PREAMBLE_Y,
+    TRANSITIONS_OK,
+    TEST_SUBFRAME,
+    FRAME_Y,
+    FRAME_Z,
+    PREAMBLE_MASK,
+    extract_preamble,
+    Frames,
+    sub_frame_string,
+    subframe_word_string,
+    Audio_func,
+    Stream_cache,
+    stream_cache,
+    freq_for_sample_rate,
+    Stream_plan,
+    blocks_for_samples,
+    transition_words,
+)
+from spdif_streams import Compact_stream, Edge_timing, Recorded_stream, load_stream_file  # noqa: F401
+from spdif_trace import Trace_recorder
+
 
 #####
-# These tests analyse the transitions rather than the pin value
-# eg. '011101000' or '100010111' -> '10011100'
+# Simulator threads pass results to conftest.py by appending them to the file named by the
+# SPDIF_SIM_RESULTS_FILE environment variable, which is set while each test runs. They are attached
+# to the test's report as user properties.
+#
+# record_sim_cycles() records how many core cycles have been simulated, which conftest.py uses to
+# order the tests on later runs. It is called by the thread that ends the simulation, and also
+# records the simulator callbacks made and saved by the Spdif_tx threads of the simulation, as
+# "tx_callbacks", since they never finish themselves.
 #####
-PREAMBLE_Z = "10011100"
-PREAMBLE_X = "10010011"
-PREAMBLE_Y = "10010110"
-TRANSITIONS_OK = "1111111111111111111111111111"
-TEST_SUBFRAME = PREAMBLE_Y + TRANSITIONS_OK + TRANSITIONS_OK
-
-
-def extract_preamble(subframe: int):
-    pre = subframe & 0xC
-    pre = (
-        "Z"
-        if pre == 0x8
-        else "X"
-        if pre == 0xC
-        else "Y"
-        if pre == 0x0
-        else "{0:02b}".format(pre >> 2)
-    )
-    return pre
+_running_transmitters = []
+
+
+def record_sim_result(name, value):
+    path = os.environ.get("SPDIF_SIM_RESULTS_FILE")
+    if path:
+        with open(path, "a") as f:
+            f.write(json.dumps({name: value}) + "\n")
+
+
+def record_sim_cycles(xsi):
+    record_sim_result("sim_cycles", xsi.get_time() // xsi._xsi._time_step)
+    if _running_transmitters:
+        record_sim_result(
+            "tx_callbacks",
+            {
+                "made": sum(tx.callbacks for tx in _running_transmitters),
+                "saved": sum(tx.callbacks_saved for tx in _running_transmitters),
+            },
+        )
+        _running_transmitters.clear()
+
+
+def sim_time_ns(xsi):
+    return xsi.get_time() * 1000 // (xsi._xsi._time_step * xsi._xsi.xe.freq)
+
+
+# True for a subframe word with a valid preamble and even parity over the data bits, as checked by
+# spdif_rx_check_parity() in the receiver
+def subframe_ok(word: int):
+    return (word & PREAMBLE_MASK) != 0x4 and bin(word >> 4).count("1") % 2 == 0
 
 
 #####
@@ -49,22 +98,84 @@ class Clock(SimThread):
             self._pin = 1 - self._pin
             self.xsi.drive_port_pins(self._port, self._pin)
 
+    def _get_tick(self):
+        return self.xsi._xsi._time_step * self.xsi._xsi.xe.freq * 1000000  # Hz from MHz
+
     def _get_next_interval(self):
-        tick = self.xsi._xsi._time_step * self.xsi._xsi.xe.freq * 1000000  # Hz from MHz
+        tick = self._get_tick()
         interval = (tick + self._interval_carry) // self._freq_Hz
         self._interval_carry = (tick + self._interval_carry) % self._freq_Hz
         return interval
 
 
+#####
+# Connects an output pin of the xe to an input pin, using the simulator's loopback plugin, so the
+# connection costs no Python callbacks
+#####
+class Loopback_port:
+    def __init__(self, src_port: str, dst_port: str):
+        self._src_port = src_port
+        self._dst_port = dst_port
+
+    def simargs(self):
+        ports = [port.replace(":", " ") for port in (self._src_port, self._dst_port)]
+        return [
+            "--plugin",
+            "LoopbackPort.dll",
+            f"-port {ports[0]} 1 0 -port {ports[1]} 1 0",
+        ]
+
+
 #####
 # Python spdif receiver, used for testing the output from the spdif transmitter running in the simulator.
+#
+# By default the thread only wakes when the pin changes. The time since the previous change is
+# rounded to a number of half-bit cells, which are shifted into a 64 cell transition history held
+# as an integer (oldest cell in the top bit) that is checked for preambles after every cell.
+#
+# Given nominal_freq (the UI rate the transmitter should produce, see freq_for_sample_rate()) the
+# time of every edge is kept too, and once the samples have been received their timing is recorded
+# as "tx_timing" (see Edge_timing in spdif_streams.py). An error is printed, so the test fails, if
+# any edge is further than max_edge_deviation UI from where it should be. nominal_freq must be the
+# rate given by the master clock actually driven to the transmitter, which is recorded with the
+# timing when given as mclk_freq, so that any drift is the transmitter's own.
+#
+# Given trace_file, or with the SPDIF_TRACE_FILE environment variable set, the transition history of each subframe
+# and when it was seen are also written to a binary trace (see spdif_trace.py).
+#
+# Given check_frames, the Frames expected, the subframes are checked against it once they have all been received
+# rather than printed, and, as for Port_monitor, "PASS" is printed if they and their timing are all correct.
 #####
 class Spdif_rx(Clock):
-    def __init__(self, port: str, sam_freq: int, no_of_samples: int):
+    def __init__(
+        self,
+        port: str,
+        sam_freq: int,
+        no_of_samples: int,
+        edges_only=True,
+        nominal_freq=None,
+        max_edge_deviation=None,
+        trace_file=None,
+        mclk_freq=None,
+        check_frames=None,
+    ):
         super().__init__(port, sam_freq)
         self._no_of_samples = no_of_samples
+        self._edges_only = edges_only
+        self._nominal_freq = nominal_freq
+        self._mclk_freq = mclk_freq
+        self._max_edge_deviation = max_edge_deviation
+        self._edge_times = array("q")
+        self._trace_file = trace_file if trace_file is not None else os.environ.get("SPDIF_TRACE_FILE")
+        self._check_frames = check_frames
+        self._histories = array("Q")  # transition history of each subframe, when checking them
 
     def run(self):
+        self._trace = Trace_recorder(self._trace_file, "transitions") if self._trace_file else None
+        if self._edges_only:
+            self._run_edges()
+            return
+
         time = self.xsi.get_time()
         sample_counter = 0
         in_buff = ""
@@ -75,28 +186,163 @@ class Spdif_rx(Clock):
             in_buff = in_buff[-63:] + ("1" if self._pin ^ pin else "0")
             self._pin = pin
             if in_buff[:8] in [PREAMBLE_Z, PREAMBLE_X, PREAMBLE_Y]:
-                print(sub_frame_string(sample_counter, in_buff))
+                if self._check_frames is None:
+                    print(sub_frame_string(sample_counter, in_buff))
+                else:
+                    self._histories.append(int(in_buff, 2))
+                if self._trace is not None:
+                    self._trace.word(sim_time_ns(self.xsi), sample_counter, int(in_buff, 2))
             if in_buff[:8] == PREAMBLE_Y:
                 sample_counter += 1
                 if sample_counter >= self._no_of_samples:
-                    self.terminate()
+                    self._finish()
+
+    def _finish(self):
+        if self._trace is not None:
+            self._trace.save()
+        passed = self._check_timing() if self._nominal_freq and self._edges_only else True
+        if self._check_frames is not None and self._check_subframes() and passed:
+            print("PASS")
+        record_sim_cycles(self.xsi)
+        self.terminate()
+
+    def _check_subframes(self):
+        words, transitions_ok = transition_words(self._histories)
+        expect = self._check_frames.words()[: self._no_of_samples * 2]
+        no_of_checked = min(len(words), len(expect))
+        bad = (words[:no_of_checked] != expect[:no_of_checked]) | ~transitions_ok[:no_of_checked]
+        mismatches = np.append(np.flatnonzero(bad), np.arange(no_of_checked, max(len(words), len(expect))))
+        # Strings are only made for the report, for the subframes that do not match
+        for i in mismatches.tolist():
+            expected = "-" if i >= len(expect) else subframe_word_string(i // 2, int(expect[i]))
+            seen = "-" if i >= len(words) else sub_frame_string(i // 2, "{:064b}".format(self._histories[i]))
+            print(f"Expected: {expected} Seen:     {seen}")
+        return len(mismatches) == 0
+
+    def _check_timing(self):
+        tick = self._get_tick()
+        times_ns = np.frombuffer(self._edge_times, dtype=np.int64) * (1e9 / tick)
+        timing = Edge_timing(times_ns, 1e9 / self._nominal_freq)
+        record_sim_result("tx_timing", dict(timing.summary(bin_size=1), mclk_Hz=self._mclk_freq))
+        if self._max_edge_deviation is None:
+            return True
+        passed = True
+        for name, deviation in (
+            ("edge", timing.max_time_deviation()),
+            ("pulse width", timing.max_interval_deviation()),
+        ):
+            if deviation > self._max_edge_deviation:
+                print(
+                    f"ERROR: {name} out by {deviation:.3f} UI, more than {self._max_edge_deviation} UI"
+                )
+                passed = False
+        if timing.invalid.any() or timing.misaligned_subframes:
+            print(
+                f"ERROR: {np.count_nonzero(timing.invalid)} pulses longer than 3 UI, "
+                f"{timing.misaligned_subframes} subframes not 64 UI apart"
+            )
+            passed = False
+        return passed
+
+    def _run_edges(self):
+        preambles = [int(pre, 2) << 56 for pre in (PREAMBLE_Z, PREAMBLE_X, PREAMBLE_Y)]
+        preamble_y = preambles[2]
+        preamble_mask = 0xFF << 56
+        history_mask = (1 << 64) - 1
+        tick = self._get_tick()
+        last_time = self.xsi.get_time()
+        history = 0
+        sample_counter = 0
+
+        def shift_in(transition):
+            nonlocal history, sample_counter
+            history = ((history << 1) | transition) & history_mask
+            preamble = history & preamble_mask
+            if preamble in preambles:
+                if self._check_frames is None:
+                    print(sub_frame_string(sample_counter, "{:064b}".format(history)))
+                else:
+                    self._histories.append(history)
+                if self._trace is not None:
+                    self._trace.word(sim_time_ns(self.xsi), sample_counter, history)
+                if preamble == preamble_y:
+                    sample_counter += 1
+                    if sample_counter >= self._no_of_samples:
+                        self._finish()
+
+        while True:
+            self.wait_for_port_pins_change([self._port])
+            pin = self.xsi.sample_port_pins(self._port)
+            if pin == self._pin:
+                continue
+            time = self.xsi.get_time()
+            if self._nominal_freq:
+                self._edge_times.append(time)
+            cells = (2 * (time - last_time) * self._freq_Hz + tick) // (2 * tick)
+            last_time = time
+            self._pin = pin
+            # Cells beyond the length of the history only shift in more zeros
+            for _ in range(min(int(cells) - 1, 64)):
+                shift_in(0)
+            shift_in(1)
 
 
 #####
 # Container class to provide as an input to the Spdif_tx class
 #####
 class Spdif_tx_stream:
-    def __init__(self, data: bytearray, freq: int):
-        self._data = data  # binary data representing the signal to be transmitted
+    def __init__(self, data: bytearray | Compact_stream, freq: int):
+        self._data = data  # binary data, or run lengths, representing the signal to be transmitted
         self._freq = freq  # frequency at which to transmit the individual bits in the binary data
 
 
+#####
+# Finds where the level changes in a bit representation of a signal, or a Compact_stream. Returns the
+# number of bits and the positions (bit indexes) and new levels of the changes, first for playing the
+# data once from the start, where the first bit is always driven, and then for each repeat of the data.
+#####
+def edge_timeline(data: bytearray | Compact_stream):
+    if isinstance(data, Compact_stream):
+        first = data.edges()
+        levels = data.levels()
+        no_of_bits = len(data)
+    else:
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder="little")
+        first = np.concatenate(([0], np.flatnonzero(bits[1:] != bits[:-1]) + 1))
+        levels = bits[first]
+        no_of_bits = len(bits)
+    if levels[0] != levels[-1] or len(first) == 1:
+        repeat = np.arange(len(first))
+    else:
+        repeat = np.arange(1, len(first))
+    return (
+        no_of_bits,
+        (first.tolist(), levels.tolist()),
+        (first[repeat].tolist(), levels[repeat].tolist()),
+    )
+
+
 #####
 # Python transmitter used to drive a bit representation of spdif data into the simulator
+#
+# By default the data is played back from an edge timeline: the thread only wakes when the level
+# on the pin changes, at the same times the bit-by-bit playback would have changed it. The number
+# of simulator callbacks made and avoided are kept in .callbacks and .callbacks_saved, and recorded
+# as the "tx_callbacks" result of the test when the simulation ends (see record_sim_cycles()).
+#
+# The streams are played one after another, changing each time another thread calls trigger_thread(). The
+# signal stops for gaps_ns[i] before stream i + 1 starts, or for a fixed time if no gaps are given, and
+# the simulated time each stream starts is kept in .stream_start_ns.
 #####
 class Spdif_tx(Clock):
     def __init__(
-        self, port: str, streams: list[Spdif_tx_stream], trigger_pin=None, polarity=0
+        self,
+        port: str,
+        streams: list[Spdif_tx_stream],
+        trigger_pin=None,
+        polarity=0,
+        edges_only=True,
+        gaps_ns=None,
     ):
         super().__init__(port, streams[0]._freq, polarity)
         self._streams = (
@@ -105,6 +351,11 @@ class Spdif_tx(Clock):
         self._trigger_pin = trigger_pin  # If provided with a pin it will wait for a ready signal from the xe before transmitting
         self._trigger_thread = False  # Other simthreads can call the trigger() method to signal to this thread to change stream
         self._terminate_thread = False
+        self._edges_only = edges_only  # Only wake the thread when the pin level changes
+        self.callbacks = 0
+        self.callbacks_saved = 0
+        self.gaps_ns = gaps_ns  # Time with no signal before each stream after the first
+        self.stream_start_ns = []
 
     def run(self):
         # Drives the bit representation of the signal byte-array, repeating forever, until the thread trigger is set
@@ -118,12 +369,42 @@ class Spdif_tx(Clock):
                     for i in range(8):
                         time += self._get_next_interval()
                         self.wait_until(time)
+                        self.callbacks += 1
                         bit = (byte >> i) & 0x1
                         self.xsi.drive_port_pins(self._port, bit)
                     if self._trigger_thread:
                         self._trigger_thread = False
                         return
 
+        # As tx_bytes(), but the time of each change in level is calculated directly from its bit
+        # index so the bits in between do not need to be visited
+        def tx_edges(signal_bytes: bytearray, delay: int):
+            start = self.xsi.get_time()
+            start += delay
+            self.wait_until(start)
+
+            tick = self._get_tick()
+            freq = self._freq_Hz
+            carry = self._interval_carry
+            no_of_bits, timeline, repeat = edge_timeline(signal_bytes)
+            offset = 0
+            last = -1
+            while 1:
+                for idx, level in zip(*timeline):
+                    bit = offset + idx
+                    self.wait_until(start + ((bit + 1) * tick + carry) // freq)
+                    self.callbacks += 1
+                    self.callbacks_saved += bit - last - 1
+                    last = bit
+                    if self._trigger_thread:
+                        self._trigger_thread = False
+                        self._interval_carry = ((bit + 1) * tick + carry) % freq
+                        return
+                    self.xsi.drive_port_pins(self._port, level)
+                offset += no_of_bits
+                timeline = repeat
+
+        _running_transmitters.append(self)
         if self._trigger_pin is not None:
             self.wait_for_port_pins_change([self._trigger_pin])
 
@@ -131,8 +412,15 @@ class Spdif_tx(Clock):
         for idx in range(len(self._streams)):
             stream = self._streams[idx]
             self._freq_Hz = stream._freq
-            tx_bytes(stream._data, delay)
-            # TODO: make this delay random
+            if idx > 0 and self.gaps_ns is not None:
+                delay = self.gaps_ns[idx - 1] * self._get_tick() // 1000000000
+            self.stream_start_ns.append(int((self.xsi.get_time() + delay) * 1000000000 // self._get_tick()))
+            if self._edges_only:
+                tx_edges(stream._data, delay)
+            elif isinstance(stream._data, Compact_stream):
+                tx_bytes(stream._data.to_stream(), delay)
+            else:
+                tx_bytes(stream._data, delay)
             delay = 35e12
 
     def trigger_thread(self):
@@ -142,6 +430,23 @@ class Spdif_tx(Clock):
 #####
 # Monitors a 32bit wide port which the xe in the simulator is using to "display" how it has interpreted spdif data
 # to the outside world.
+#
+# The time the receiver takes to lock is recorded in .lock_times, one entry per stream: the simulated ns from the
+# start of the stream to the first parity clean subframe, to the first parity clean Z subframe, and to the start
+# of the run of clean subframes leading up to that Z (locked_ns). These are also recorded as the "lock_times"
+# result of the test (see record_sim_result()).
+#
+# When the stream changes, the lock times are also added to .relock_times with the sample rates changed between,
+# where in the stream the change was made (see switch_subframes) and the gap before the new stream (see Spdif_tx).
+# These are recorded as the "relock_times" result.
+#
+# Whether the subframes received from each stream matched its check_frames is kept in .segment_results, and with
+# more than one stream is recorded as the "segment_results" result, so the streams of several tests can be checked
+# in one simulation (see Sim_case). A stream left unchecked, after max_errors ended the simulation, has no entry.
+#
+# Given trace_file, or with the SPDIF_TRACE_FILE environment variable set, every word on the debug port, when it was
+# seen and every change of the strobe are written to a binary trace (see spdif_trace.py). With print_frame off this
+# keeps a record of a long run without formatting each subframe as text.
 #####
 class Port_monitor(SimThread):
     def __init__(
@@ -152,6 +457,9 @@ class Port_monitor(SimThread):
         spdif_tx: Spdif_tx | None = None,
         print_frame: bool = False,
         check_frames: list | None = None,
+        max_errors: int | None = None,
+        switch_subframes: list[int] | None = None,
+        trace_file: str | None = None,
     ):
         self._p_debug = p_debug  # 32 bit port the xe file is outputting data on
         self._p_debug_strobe = (
@@ -165,359 +473,436 @@ class Port_monitor(SimThread):
             check_frames  # Frames() to check against if internal checking is required
         )
         self._spdif_tx = spdif_tx  # Spdif_tx object so that a change of input stream can be triggered
+        self.lock_times = []
+        self.relock_times = []
+        self.segment_results = []
+        self._max_errors = (
+            max_errors  # Check each subframe as it arrives and end the simulation after this many errors
+        )
+        self._switch_subframes = (
+            switch_subframes  # Number of subframes to wait before each change of stream, to vary where it happens
+        )
+        self._trace_file = (
+            trace_file if trace_file is not None else os.environ.get("SPDIF_TRACE_FILE")
+        )  # File to write a binary trace of the debug port to, see spdif_trace.py
 
     def run(self):
-        def capture_subframes(cf):
+        trace = Trace_recorder(self._trace_file, "debug") if self._trace_file else None
+
+        # Waits for the strobe to change and returns its new level
+        def strobe_changed():
+            self.wait_for_port_pins_change([self._p_debug_strobe])
+            strobe = self.xsi.sample_port_pins(self._p_debug_strobe)
+            if trace is not None:
+                trace.strobe(sim_time_ns(self.xsi), strobe)
+            return strobe
+
+        def capture_subframes(cf, recent):
             found = 0
-            frames = []
+            words = array("I")
             init_values = cf is None
+            checker = None
+            lock = {"first_sample_ns": None, "first_z_ns": None, "locked_ns": None}
+            self.lock_times.append(lock)
             while self._no_of_samples == 0 or found < self._no_of_samples:
-                self.wait_for_port_pins_change([self._p_debug_strobe])
-                if self.xsi.sample_port_pins(self._p_debug_strobe) == 1:
+                if strobe_changed() == 1:
                     debug = self.xsi.sample_port_pins(self._p_debug)
-                    pre = extract_preamble(debug)
-                    if found or pre == "Z":
-                        sample = "{0:032b}".format(debug)[::-1]
-                        frames.append(
-                            f"{(found)//2} [{pre}] - {sample[4::]} {TRANSITIONS_OK}"
-                        )
+                    if trace is not None:
+                        counted = found or (debug & PREAMBLE_MASK) == FRAME_Z
+                        trace.word(sim_time_ns(self.xsi), found // 2 if counted else -1, debug)
+                    if lock["first_z_ns"] is None:
+                        time = sim_time_ns(self.xsi)
+                        recent.append((time, debug))
+                        if subframe_ok(debug):
+                            if lock["first_sample_ns"] is None:
+                                lock["first_sample_ns"] = time
+                            if (debug & PREAMBLE_MASK) == FRAME_Z:
+                                lock["first_z_ns"] = time
+                                lock["locked_ns"] = locked_since(recent)
+                    if found or (debug & PREAMBLE_MASK) == FRAME_Z:
+                        words.append(debug)
                         if not init_values:
                             init_values = cf.log_initial_value(
                                 (debug & 0x0FFFFFF0) >> 4
                             )
                         if self._print_frame:
-                            print(frames[-1])
+                            print(subframe_word_string(found // 2, debug))
                         found += 1
-            return frames
-
-        def check_block(frames, cf):
-            success = True
-            expect = cf.expect()
-            expect = expect[: self._no_of_samples]
-            for i in range(max(len(frames), len(expect))):
-                expected = "-" if i >= len(expect) else expect[i]
-                sub_frame = "-" if i >= len(frames) else frames[i]
-                if sub_frame != expected:
-                    print(f"Expected: {expected} Seen:     {sub_frame}")
-                    success = False
-            return success
+                        if self._max_errors is None or not init_values or cf is None:
+                            continue
+                        # The expected values are only known once the initial values are logged
+                        if checker is None:
+                            checker = Subframe_checker(cf.iter_words(), self._max_errors)
+                        while checker.position < len(words):
+                            if not checker.check(words[checker.position]):
+                                print(
+                                    f"Stopped after {checker.errors} errors at subframe {checker.position - 1} "
+                                    f"(sample {(checker.position - 1) // 2}), {sim_time_ns(self.xsi)} ns"
+                                )
+                                return words, checker
+            return words, checker
+
+        # The time of the first of the clean subframes, with preambles alternating between X or Z and
+        # Y, that lead up to the last one received
+        def locked_since(recent):
+            i = len(recent) - 1
+            while i > 0:
+                prev, word = recent[i - 1][1], recent[i][1]
+                if not subframe_ok(prev) or ((prev & PREAMBLE_MASK) == FRAME_Y) == ((word & PREAMBLE_MASK) == FRAME_Y):
+                    break
+                i -= 1
+            return recent[i][0]
+
+        def check_block(words, cf):
+            # Only the preamble and data bits are checked, the bottom two bits are unused
+            seen = np.frombuffer(words, dtype=np.uint32) & ~np.uint32(0x3)
+            expect = cf.words()[: self._no_of_samples] & ~np.uint32(0x3)
+            no_of_checked = min(len(seen), len(expect))
+            mismatches = np.flatnonzero(seen[:no_of_checked] != expect[:no_of_checked])
+            mismatches = np.append(mismatches, np.arange(no_of_checked, max(len(seen), len(expect))))
+            # Strings are only made for the report, for the subframes that do not match
+            for i in mismatches.tolist():
+                print_mismatch(
+                    i,
+                    None if i >= len(expect) else int(expect[i]),
+                    None if i >= len(seen) else int(seen[i]),
+                )
+            return len(mismatches) == 0
 
         result = True
         iters = len(self._check_frames) if self._check_frames is not None else 1
         for idx in range(iters):
+            start_ns = sim_time_ns(self.xsi)
+            # Subframes received since the stream started, with their times, until the first Z
+            recent = []
             if idx > 0:
+                # Move the switch to a later point in the stream
+                if self._switch_subframes is not None:
+                    for _ in range(self._switch_subframes[idx - 1]):
+                        while strobe_changed() != 1:
+                            pass
+                        if trace is not None:
+                            trace.word(sim_time_ns(self.xsi), -1, self.xsi.sample_port_pins(self._p_debug))
+                start_ns = sim_time_ns(self.xsi)
                 self._spdif_tx.trigger_thread()
                 # Ignore the first samples that are produced after the stream changes because they can be corrupted
                 for _ in range(32):
-                    self.wait_for_port_pins_change([self._p_debug_strobe])
-                    if self.xsi.sample_port_pins(self._p_debug_strobe) == 1:
-                        _val = self.xsi.sample_port_pins(self._p_debug)
+                    if strobe_changed() == 1:
+                        time, debug = sim_time_ns(self.xsi), self.xsi.sample_port_pins(self._p_debug)
+                        recent.append((time, debug))
+                        if trace is not None:
+                            trace.word(time, -1, debug)
 
             try:
                 cf = self._check_frames[idx]
             except IndexError:
                 cf = None
-            frames = capture_subframes(cf)
-            if cf:
-                check = check_block(frames, cf)
+            words, checker = capture_subframes(cf, recent)
+
+            # Lock times are from the start of the stream, which with a gap before it is later than the switch
+            if self._spdif_tx is not None and idx < len(self._spdif_tx.stream_start_ns):
+                start_ns = self._spdif_tx.stream_start_ns[idx]
+            lock = self.lock_times[-1]
+            if lock["locked_ns"] is not None:
+                lock["locked_ns"] = max(lock["locked_ns"], start_ns)
+            for name, time in lock.items():
+                if time is not None:
+                    lock[name] = int(time - start_ns)
+            if idx > 0 and self._check_frames is not None:
+                self.relock_times.append(
+                    {
+                        "from_sam_freq": self._check_frames[idx - 1].sam_freq,
+                        "to_sam_freq": cf.sam_freq,
+                        "switch_subframes": self._switch_subframes[idx - 1] if self._switch_subframes else 0,
+                        "gap_ns": self._spdif_tx.gaps_ns[idx - 1] if self._spdif_tx.gaps_ns else None,
+                        **lock,
+                    }
+                )
+
+            if checker is not None:
+                self.segment_results.append(checker.errors == 0)
+                result &= checker.errors == 0
+                if checker.errors >= self._max_errors:
+                    break
+            elif cf:
+                check = check_block(words, cf)
+                self.segment_results.append(check)
                 result &= check
+            else:
+                self.segment_results.append(True)
 
         if result:
             print("PASS")
+        record_sim_result("lock_times", self.lock_times)
+        if self.relock_times:
+            record_sim_result("relock_times", self.relock_times)
+        if len(self.segment_results) > 1:
+            record_sim_result("segment_results", self.segment_results)
+        if trace is not None:
+            trace.save()
+        record_sim_cycles(self.xsi)
         self.terminate()
 
 
+def print_mismatch(i, expected, seen):
+    expected = "-" if expected is None else subframe_word_string(i // 2, expected)
+    seen = "-" if seen is None else subframe_word_string(i // 2, seen)
+    print(f"Expected: {expected} Seen:     {seen}")
+
+
 #####
-# The Frames class constructs an S/PDIF signal either to feed into the simulator to test
-# the receiver or to check an output against.
-# TODO - this class currently uses strings, it would probably be better to use a byte array
-#
-# .log_initial_value( int value )
-#          used by Port_monitor after the first frame has been observed so that when
-#          .expect() is called to check checks are conducted against a matching
-#
-# .expect()
-#          outputs an array of strings representing the expected decoded spdif signal
-#
-# .stream()
-#          outputs a byte array representing the spdif signal that can be driven on a pin for
-#          the simulator to decode back into spdif data
+# Checks subframe words one at a time against expected words pulled from an iterator, such as
+# Frames.iter_words(), printing each mismatch. .check(word) returns False once max_errors have
+# been seen, so the caller can stop there rather than capturing the rest of the stream.
+#####
+class Subframe_checker:
+    def __init__(self, expected, max_errors: int):
+        self._expected = iter(expected)
+        self._max_errors = max_errors
+        self.errors = 0
+        self.position = 0  # number of subframes checked
+
+    def check(self, word: int):
+        expected = next(self._expected, None)
+        # Only the preamble and data bits are checked, the bottom two bits are unused
+        if expected is None or (word ^ expected) & ~0x3:
+            print_mismatch(self.position, expected, word)
+            self.errors += 1
+        self.position += 1
+        return self.errors < self._max_errors
+
+
+#####
+# Measures the latency from spdif_tx to spdif_rx in an xe that connects the two (see test_loopback).
+# The xe outputs the tag in each sample pair it gives the transmitter on p_tag, as soon as
+# spdif_tx_output() returns, and each parity clean subframe received on p_debug, as for Port_monitor.
+# Tags count up from 1 through the segments, each a (sam_freq, no_of_samples) the transmitter is
+# configured for in turn.
 #
+# The latency of each left channel sample is the simulated time from its tag being output to it being
+# received. For each segment the first, minimum, median and maximum latencies, in ns and in samples at
+# the segment's rate, and the number of samples not received (eg. while the receiver relocks) are
+# recorded as the "latency" result of the test. Once the receiver has output a sample from a segment it
+# is an error for it to miss any of the rest.
 #####
-class Frames:
+class Latency_monitor(SimThread):
     def __init__(
         self,
-        sources=None,
-        channels=None,
-        no_of_blocks=0,
-        # byte 0
-        pro=False,
-        digital_audio=True,
-        copyright=False,
-        preEmphasis="000",
-        mode=0,
-        # byte 1
-        catagory_code="digital/digital converters",
-        catagory="other",
-        L_bit=False,
-        # byte 2
-        # byte 3
-        sam_freq=44100,
-        clock_accuracy="level II",
-        # byte 4
-        bit_depth=24,
-        original_sam_freq=0,  # unknown
-        # byte 5-23
-        extra=None,  # List of bytes
+        p_tag: str,
+        p_tag_strobe: str,
+        p_debug: str,
+        p_debug_strobe: str,
+        segments: list[tuple[int, int]],
     ):
-        # self.expect = ""
-        self._no_of_samples = no_of_blocks * 192
-        self._samples = None
-        self._initial_values = []
-        if sources is not None:
-            self._audio = sources
-        elif channels is not None:
-            self._audio = channels
-        else:
-            # Error no channels or sources
-            pass
-        self._validity_flag = []
-        self._user_data = []
-        self._channel_status = []
-        for i, _ in enumerate(self._audio):
-            self._validity_flag.append("0")
-            self._user_data.append("0")
-            self._channel_status.append(
-                self._get_byte_0(pro, digital_audio, copyright, preEmphasis, mode)
-                + self._get_byte_1(catagory_code, catagory, L_bit)
-                + self._get_byte_2(
-                    i + 1 if sources is not None else 0,
-                    i + 1 if channels is not None else 0,
-                )
-                + self._get_byte_3(sam_freq, clock_accuracy)
-                + self._get_byte_4(bit_depth, original_sam_freq)
-                + self._get_byte_extra(extra)
-            )
+        self._p_tag = p_tag
+        self._p_tag_strobe = p_tag_strobe
+        self._p_debug = p_debug
+        self._p_debug_strobe = p_debug_strobe
+        self._segments = segments
+        self.latencies = []
 
-    def _get_byte_0(self, pro, digital_audio, copyright, preEmphasis, mode):
-        byte = ""
-        byte += "1" if pro else "0"
-        byte += "1" if not digital_audio else "0"
-        byte += "1" if not copyright else "0"
-        byte += preEmphasis
-        byte += "{:02b}".format(mode)
-        return byte
-
-    def _get_byte_1(self, catagory_code, catagory, L_bit):
-        byte = ""
-        if catagory_code == "digital/digital converters":
-            byte += "010"
-            if catagory == "other":
-                byte += "1111"
-            else:
-                raise Exception(
-                    "Unsupported device catagory, if input is correct please add support to Frames"
-                )
-        else:
-            raise Exception(
-                "Unsupported device catagory, if input is correct please add support to Frames"
-            )
-        byte += "1" if L_bit else "0"
-        return byte
-
-    def _get_byte_2(self, source_No, channel_No):
-        byte = ""
-        byte += "{:04b}".format(source_No)[::-1]
-        byte += "{:04b}".format(channel_No)[::-1]
-        return byte
-
-    def _get_byte_3(self, sam_freq, clock_accuracy):
-        byte = ""
-        if sam_freq == 22050:
-            byte = "0010"
-        elif sam_freq == 44100:
-            byte = "0000"
-        elif sam_freq == 88200:
-            byte = "0001"
-        elif sam_freq == 176400:
-            byte = "0011"
-        elif sam_freq == 24000:
-            byte = "0110"
-        elif sam_freq == 48000:
-            byte = "0100"
-        elif sam_freq == 96000:
-            byte = "0101"
-        elif sam_freq == 192000:
-            byte = "0111"
-        else:
-            raise Exception(
-                "Unsupported Sample rate, if input is correct please add support to Frames"
-            )
-        if clock_accuracy == "level II":
-            byte += "00"
-        else:
-            raise Exception(
-                "Unsupported Clock accuracy, if input is correct please add support to Frames"
-            )
-        byte += "00"
-        return byte
-
-    def _get_byte_4(self, bit_depth, original_sam_freq):
-        # there are 2 options for 20bits this needs sorting for tests that involve a bit depth of 20
-        byte = ""
-        byte += "1" if bit_depth > 20 else "0"
-        if bit_depth in [20, 16]:
-            byte += "100"
-        elif bit_depth in [22, 18]:
-            byte += "010"
-        elif bit_depth in [23, 19]:
-            byte += "001"
-        elif bit_depth in [24, 20]:
-            byte += "101"
-        elif bit_depth in [21, 17]:
-            byte += "011"
-        else:
-            byte += "000"
-        if original_sam_freq == 0:
-            byte += "0000"
-        else:
-            raise Exception(
-                "Unsupported original sample rate, if input is correct please add support to Frames"
-            )
-        return byte
-
-    def _get_byte_extra(self, extra):
-        byte = ""
-        if extra is None:
-            for _ in range(19):
-                byte += "00000000"
-        else:
-            raise Exception(
-                "Unsupported extra data, if input is correct please add support to Frames"
-            )
-        return byte
-
-    def log_initial_value(self, value):
-        if len(self._initial_values) < len(self._audio):
-            self._initial_values.append(value)
-        return len(self._initial_values) == len(self._audio)
-
-    def _construct_out(self):
-        frames = []
-        samples = []
-        for i, chan in enumerate(self._audio):
-            samples.append([])
-            value = 0 if i >= len(self._initial_values) else self._initial_values[i]
-            audio_func = Audio_func(chan[0], chan[1]).next
-            for _ in range(self._no_of_samples):
-                samples[i].append("{:024b}".format(((1 << 24) - 1) & value)[::-1])
-                value = audio_func(value)
-        for j, _ in enumerate(samples[0]):
-            for i, _ in enumerate(samples):
-                if i == 0 and j % 192 == 0:
-                    pre = PREAMBLE_Z
-                elif i == 0:
-                    pre = PREAMBLE_X
-                else:
-                    pre = PREAMBLE_Y
-                subframe = samples[i][j]
-                subframe += self._validity_flag[i][j % len(self._validity_flag[i])]
-                subframe += self._user_data[i][j % len(self._user_data[i])]
-                subframe += self._channel_status[i][j % len(self._channel_status[i])]
-                subframe += "1" if subframe.count("1") & 0x1 else "0"
-                frame = pre + "".join(
-                    clock + data for clock, data in zip(TRANSITIONS_OK, subframe)
-                )
-                frames.append(frame)
-        return frames
-
-    def expect(self):
-        expect = []
-        for i, subframe in enumerate(self._construct_out()):
-            expect.append(sub_frame_string(i // len(self._audio), subframe))
-        return expect
-
-    def stream(self, quick_start_offset=0, polarity=0):
-        lines = self._construct_out()
-        stream = b""
-        for line in lines[quick_start_offset:] + lines[:quick_start_offset]:
-            byte = 0
-            for bit in line[::-1]:
-                bit = (byte & 0x1) if bit == "0" else 1 - (byte & 0x1)
-                byte = (byte << 1) | bit
-            stream += byte.to_bytes(8, "little")
-        return stream
+    def run(self):
+        no_of_tags = sum(no_of_samples for _, no_of_samples in self._segments)
+        sent = {}
+        received = {}
+        strobes = [self._p_tag_strobe, self._p_debug_strobe]
+        levels = [0, 0]
+        while True:
+            self.wait_for_port_pins_change(strobes)
+            time = sim_time_ns(self.xsi)
+            tag_strobe, debug_strobe = (self.xsi.sample_port_pins(strobe) for strobe in strobes)
+            # Both strobes are watched, so only act when one rises
+            if tag_strobe and not levels[0]:
+                sent[self.xsi.sample_port_pins(self._p_tag)] = time
+            if debug_strobe and not levels[1]:
+                word = self.xsi.sample_port_pins(self._p_debug)
+                if subframe_ok(word) and (word & PREAMBLE_MASK) != FRAME_Y:
+                    tag = (word >> 4) & 0xFFFFFF
+                    if tag in sent and tag not in received:
+                        received[tag] = time
+                    # Silence follows the last tag, so stop there even if the last tag was missed
+                    if tag == no_of_tags or (tag == 0 and len(sent) == no_of_tags):
+                        break
+            levels = [tag_strobe, debug_strobe]
 
+        result = True
+        first = 1
+        for sam_freq, no_of_samples in self._segments:
+            tags = [tag for tag in range(first, first + no_of_samples) if tag in received]
+            first += no_of_samples
+            latency = {"sam_freq": sam_freq, "lost": no_of_samples - len(tags)}
+            if not tags:
+                print(f"ERROR: no samples received at {sam_freq} Hz")
+                result = False
+            elif tags[-1] - tags[0] + 1 != len(tags):
+                print(f"ERROR: {tags[-1] - tags[0] + 1 - len(tags)} samples missed at {sam_freq} Hz after lock")
+                result = False
+            if tags:
+                ns = np.array([received[tag] - sent[tag] for tag in tags])
+                for name, value in (
+                    ("first", ns[0]),
+                    ("min", ns.min()),
+                    ("median", np.median(ns)),
+                    ("max", ns.max()),
+                ):
+                    latency[f"{name}_ns"] = float(value)
+                    latency[f"{name}_samples"] = float(value) * sam_freq / 1e9
+            self.latencies.append(latency)
 
-#####
-# Provides a single place that determines how sub-frames are displayed. Takes a sample number and the subframe
-# and outputs that as a string for printing and checking against.
-#####
-def sub_frame_string(sample_no, subframe):
-    pre = subframe[:8]
-    pre = (
-        "Z"
-        if pre == PREAMBLE_Z
-        else "X"
-        if pre == PREAMBLE_X
-        else "Y"
-        if pre == PREAMBLE_Y
-        else pre
-    )
-    return f"{sample_no} [{pre}] - {subframe[9::2]} {subframe[8::2]}"
+        if result:
+            print("PASS")
+        record_sim_result("latency", self.latencies)
+        record_sim_cycles(self.xsi)
+        self.terminate()
 
 
 #####
-# Audio_func provides a class that can be given a type of test signal, fixed, ramp, none etc. and a control value
-# and output what the next sample value should be based off the previous sample value by calling .next(previous)
-#
-# The way the control value is used depends on the function type. Eg. ("ramp", 5) will output the previous value + 5
-# and ("fixed", 5) will output 5 no matter what the previous value is. Future additions could be ("sine", value)
-# where the control value is used to characterize the sine wave.
+# Sim_case describes what a test runs in the simulator, so that compatible tests can share one simulation (see
+# the --batch-sims option in conftest.py): the xe and the streams played to it one after another, eg. the
+# Recorded_streams of a test_rx_samfreq_change. Tests with the same xe are batched together.
 #####
-class Audio_func:
-    def __init__(self, type="none", value=0):
-        _type = type.lower()
-        if _type == "none":
-            self.next = self._none
-        elif _type == "fixed":
-            self.next = self._fixed
-        elif _type == "ramp":
-            self.next = self._ramp
-        else:
-            raise Exception("Unsupported audio data type")
-        self._value = value
-
-    def _none(self, previous):
-        return None
-
-    def _fixed(self, previous):
-        return self._value
-
-    def _ramp(self, previous):
-        return (previous + self._value) if previous is not None else None
+class Sim_case:
+    def __init__(self, xe, segments):
+        self.xe = xe  # path of the xe the test runs
+        self.segments = segments  # streams played, in order
 
 
 #####
-# Recorded_stream hold metadata about a bit stream representation of spdif data
+# The streams to play to run each of the cases in one simulation, and the indices of each case's streams in them.
+# A case that starts with the stream the one before it ended with carries on from it rather than repeating it.
 #####
-class Recorded_stream:
-    def __init__(self, file_name, audio, sam_freq, sample_rate):
-        self.file_name = (
-            file_name  # the binary file to be interpreted as an spdif signal
-        )
-        self.audio = audio  # Audio_func() describing the expected signal
-        self.sam_freq = sam_freq  # audio sample rate
-        self.sample_rate = sample_rate  # signal sample rate
+def batch_segments(cases):
+    segments = []
+    case_segments = []
+    for case in cases:
+        shared = 1 if segments and case.segments[0] == segments[-1] else 0
+        first = len(segments) - shared
+        segments.extend(case.segments[shared:])
+        case_segments.append(list(range(first, first + len(case.segments))))
+    return segments, case_segments
 
 
 #####
-# Returns the clock frequency for outputting audio at different sample rates
+# Sim_cache stores the verdict of each simulation that passes, with its output and the results recorded by its
+# simulator threads, so that running it again unchanged replays them rather than simulating again. Use .run() in
+# place of Pyxsim.run_on_simulator_().
+#
+# Entries are keyed on a hash of the xe, the configuration of the simulator threads (including the bytes of the
+# streams they play and the Frames they check against), the tester, the simulator arguments (including
+# --max-cycles) and the source of the modules the threads are made from, so a change to any of these runs the
+# simulation again. Failures are not stored, so are always run again. Replayed tests record the "sim_cached"
+# result, so conftest.py keeps their previous duration in the test history.
+#
+# Entries are stored as by Stream_cache, in the directory given by the SPDIF_SIM_CACHE environment variable (set by
+# conftest.py to a directory in pytest's cache) or else in the user's cache directory. The variable can be set to an
+# empty string to disable caching. Set .rerun, as the --rerun-sims option does, to run every simulation while still
+# storing the results. Simulations are also always run while the SPDIF_TRACE_FILE environment variable is set, so the
+# trace asked for is written.
 #####
-def freq_for_sample_rate(sam_freq: int):
-    freq_Hz = None
-    no_of_channels = 2
-    no_of_bits_per_sub_frame = 64  # 32 bits of data & 32 transitions
-    if sam_freq in [44100, 48000, 88200, 96000, 176400, 192000]:
-        freq_Hz = sam_freq * no_of_bits_per_sub_frame * no_of_channels
-    return freq_Hz
+class Sim_cache(Stream_cache):
+    _harness_hash = hashlib.sha256(
+        b"".join(
+            (Path(__file__).parent / name).read_bytes()
+            for name in ["spdif_test_utils.py", "spdif_frames.py", "spdif_streams.py", "spdif_trace.py"]
+        )
+    ).hexdigest()
+
+    _env = "SPDIF_SIM_CACHE"
+    _default_dir = "sims"
+
+    def __init__(self, path=None, max_bytes=64 * 1024 * 1024):
+        super().__init__(path, max_bytes)
+        self.rerun = False
+        self._xe_hashes = {}
+
+    def run(self, xe, simthreads, tester, capfd, **kwargs):
+        key = self._sim_key(xe, simthreads, tester, kwargs)
+        results_path = os.environ.get("SPDIF_SIM_RESULTS_FILE")
+        if self.rerun or os.environ.get("SPDIF_TRACE_FILE"):
+            self.misses += 1
+            data = None
+        else:
+            data = self._load(key)
+        if data is not None:
+            entry = json.loads(data)
+            print(entry["output"], end="")
+            for result in entry["sim_results"] + [{"sim_cached": True}]:
+                record_sim_result(*next(iter(result.items())))
+            return entry["verdict"]
+
+        results_start = os.path.getsize(results_path) if results_path else 0
+        capture = _Recording_capture(capfd)
+        verdict = Pyxsim.run_on_simulator_(xe, simthreads=simthreads, tester=tester, capfd=capture, **kwargs)
+        if verdict:
+            sim_results = []
+            if results_path:
+                with open(results_path) as f:
+                    f.seek(results_start)
+                    sim_results = [json.loads(line) for line in f]
+            entry = {"verdict": bool(verdict), "output": capture.out, "sim_results": sim_results}
+            self._store(key, json.dumps(entry).encode())
+        return verdict
+
+    def _sim_key(self, xe, simthreads, tester, kwargs):
+        description = {
+            "harness": self._harness_hash,
+            "xe": self._xe_hash(xe),
+            "simthreads": _describe(simthreads),
+            "tester": _describe(tester),
+            "args": _describe({name: value for name, value in kwargs.items() if name != "timeout"}),
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _xe_hash(self, xe):
+        stat = os.stat(xe)
+        version = (str(xe), stat.st_mtime_ns, stat.st_size)
+        if version not in self._xe_hashes:
+            self._xe_hashes[version] = hashlib.sha256(Path(xe).read_bytes()).hexdigest()
+        return self._xe_hashes[version]
+
+
+# Passes the output read by Pyxsim through, keeping a copy for Sim_cache
+class _Recording_capture:
+    def __init__(self, capfd):
+        self._capfd = capfd
+        self.out = ""
+
+    def readouterr(self):
+        captured = self._capfd.readouterr()
+        self.out += captured.out
+        return captured
+
+    def __getattr__(self, name):
+        return getattr(self._capfd, name)
+
+
+# A description of the configuration of an object that can be hashed, with the contents of any data hashed
+def _describe(value, parents=()):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, np.ndarray):
+        data = np.ascontiguousarray(value).tobytes()
+        return {"dtype": str(value.dtype), "shape": value.shape, "sha256": hashlib.sha256(data).hexdigest()}
+    if isinstance(value, array):
+        return {"typecode": value.typecode, "sha256": hashlib.sha256(value.tobytes()).hexdigest()}
+    if isinstance(value, (types.FunctionType, types.MethodType, types.BuiltinFunctionType)):
+        return value.__qualname__
+    if id(value) in parents:
+        return "<cycle>"
+    parents = parents + (id(value),)
+    if isinstance(value, (list, tuple)):
+        return [_describe(item, parents) for item in value]
+    if isinstance(value, dict):
+        return {str(name): _describe(item, parents) for name, item in value.items()}
+    if hasattr(value, "description"):
+        return _describe(value.description(), parents)
+    if hasattr(value, "__dict__"):
+        return {"class": type(value).__qualname__, **_describe(vars(value), parents)}
+    return repr(value)
+
+
+sim_cache = Sim_cache()
@@ -0,0 +1,228 @@
+# Copyright 2024 XMOS LIMITED.
+# This Software is subject to the terms of the XMOS Public Licence: Version 1.
+
+#####
+# Binary traces of the subframes seen by the simulator threads, written by Port_monitor and Spdif_rx when given a
+# trace file (see the --trace-dir option in conftest.py), so that a long run need not format every subframe as
+# text and the run can be looked at afterwards without simulating it again. These only need NumPy, eg.
+#
+#     python spdif_trace.py text trace.npz --preamble Z
+#     python spdif_trace.py text trace.npz --channel 1 --start-ns 2000000 --end-ns 3000000
+#
+# A trace is an NPZ file holding, for each subframe, its word, the simulated time in ns it was seen at and its
+# sample number (-1 before the first Z, which is where the text output starts), and the time and level of every
+# change of the strobe that marks each new word on the debug port. The words are either "debug" words, as output
+# by the receiver on its debug port (see Frames.words()), or "transitions", the last 64 cells of the signal seen
+# by Spdif_rx with the oldest in the top bit.
+#####
+
+import argparse
+from array import array
+from pathlib import Path
+import numpy as np
+from spdif_frames import PREAMBLE_MASK, PREAMBLE_X, PREAMBLE_Y, PREAMBLE_Z, sub_frame_string, subframe_word_string
+
+TRACE_KINDS = ["debug", "transitions"]
+
+# Preamble names by bits 2 and 3 of a debug word, as given by extract_preamble()
+_DEBUG_PREAMBLES = np.array(["Y", "01", "Z", "X"])
+_TRANSITION_PREAMBLES = {int(pre, 2): name for pre, name in ((PREAMBLE_Z, "Z"), (PREAMBLE_X, "X"), (PREAMBLE_Y, "Y"))}
+
+
+def _preambles(kind, words):
+    if kind == "debug":
+        return _DEBUG_PREAMBLES[(words & PREAMBLE_MASK) >> 2]
+    top = words >> np.uint64(56)
+    preambles = np.full(len(words), "-", dtype="<U2")
+    for pre, name in _TRANSITION_PREAMBLES.items():
+        preambles[top == pre] = name
+    return preambles
+
+
+# Subframes and strobe changes as written to the parts of a trace that is still being recorded
+_WORD_RECORD = np.dtype([("word", "<u8"), ("time_ns", "<i8"), ("sample_no", "<i8")])
+_STROBE_RECORD = np.dtype([("time_ns", "<i8"), ("level", "u1")])
+
+
+def _part_paths(path):
+    path = Path(path)
+    return {part: path.with_name(f"{path.name}.{part}.part") for part in ["kind", "words", "strobes"]}
+
+
+#####
+# Trace_recorder collects the subframes and strobe changes as they are seen, in arrays rather than lists of Python
+# ints, and appends them to the parts of the trace every chunk of them, so a simulation that is ended by
+# --max-cycles or a timeout, before its thread can call .save(), still leaves what it saw. .save() writes the trace
+# file from the parts, as finish_trace() does for a trace that was not saved.
+#####
+class Trace_recorder:
+    def __init__(self, path, kind, chunk=4096):
+        if kind not in TRACE_KINDS:
+            raise Exception(f"Unknown trace kind {kind}, expected one of {', '.join(TRACE_KINDS)}")
+        self._path = Path(path)
+        self._parts = _part_paths(self._path)
+        self._chunk = chunk
+        self._words = array("Q")
+        self._times_ns = array("q")
+        self._sample_no = array("q")
+        self._strobe_ns = array("q")
+        self._strobe_level = array("B")
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        for part in self._parts.values():
+            part.unlink(missing_ok=True)
+        self._parts["kind"].write_text(kind)
+
+    def word(self, time_ns, sample_no, word):
+        self._words.append(word)
+        self._times_ns.append(time_ns)
+        self._sample_no.append(sample_no)
+        if len(self._words) >= self._chunk:
+            self.flush()
+
+    def strobe(self, time_ns, level):
+        self._strobe_ns.append(time_ns)
+        self._strobe_level.append(level)
+        if len(self._strobe_ns) >= self._chunk:
+            self.flush()
+
+    def flush(self):
+        words = np.empty(len(self._words), dtype=_WORD_RECORD)
+        words["word"] = np.frombuffer(self._words, dtype=np.uint64)
+        words["time_ns"] = np.frombuffer(self._times_ns, dtype=np.int64)
+        words["sample_no"] = np.frombuffer(self._sample_no, dtype=np.int64)
+        strobes = np.empty(len(self._strobe_ns), dtype=_STROBE_RECORD)
+        strobes["time_ns"] = np.frombuffer(self._strobe_ns, dtype=np.int64)
+        strobes["level"] = np.frombuffer(self._strobe_level, dtype=np.uint8)
+        for name, records in (("words", words), ("strobes", strobes)):
+            with open(self._parts[name], "ab") as f:
+                f.write(records.tobytes())
+        for values in (self._words, self._times_ns, self._sample_no, self._strobe_ns, self._strobe_level):
+            del values[:]
+
+    def save(self):
+        self.flush()
+        finish_trace(self._path)
+
+
+#####
+# Writes the trace file at path from the parts left by a Trace_recorder that was not saved, eg. because the
+# simulation was ended by --max-cycles (see the --trace-dir option in conftest.py). Returns False if there are none.
+#####
+def finish_trace(path):
+    parts = _part_paths(path)
+    if not parts["kind"].exists():
+        return False
+    kind = parts["kind"].read_text()
+    words = np.fromfile(parts["words"], dtype=_WORD_RECORD) if parts["words"].exists() else np.empty(0, _WORD_RECORD)
+    strobes = (
+        np.fromfile(parts["strobes"], dtype=_STROBE_RECORD)
+        if parts["strobes"].exists()
+        else np.empty(0, _STROBE_RECORD)
+    )
+    np.savez_compressed(
+        path,
+        kind=np.array(kind),
+        words=words["word"],
+        times_ns=words["time_ns"],
+        sample_no=words["sample_no"],
+        preamble=_preambles(kind, words["word"]),
+        strobe_ns=strobes["time_ns"],
+        strobe_level=strobes["level"],
+    )
+    for part in parts.values():
+        part.unlink(missing_ok=True)
+    return True
+
+
+#####
+# A trace read back with Trace.load(path). .select() gives the part of it for a channel (0 for X and Z subframes,
+# 1 for Y), preamble or range of simulated time, and .lines() gives its subframes in the text format printed by
+# Port_monitor (with print_frame) or Spdif_rx.
+#####
+class Trace:
+    def __init__(self, kind, words, times_ns, sample_no, preamble, strobe_ns, strobe_level):
+        self.kind = kind
+        self.words = words
+        self.times_ns = times_ns
+        self.sample_no = sample_no
+        self.preamble = preamble
+        self.strobe_ns = strobe_ns
+        self.strobe_level = strobe_level
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                str(data["kind"]),
+                data["words"],
+                data["times_ns"],
+                data["sample_no"],
+                data["preamble"],
+                data["strobe_ns"],
+                data["strobe_level"],
+            )
+
+    def __len__(self):
+        return len(self.words)
+
+    @property
+    def channel(self):
+        return np.where(self.preamble == "Y", 1, 0)
+
+    # start_ns is inclusive and end_ns exclusive. The strobe changes are only selected by time.
+    def select(self, channel=None, preamble=None, start_ns=None, end_ns=None):
+        keep = np.ones(len(self.words), dtype=bool)
+        strobes = np.ones(len(self.strobe_ns), dtype=bool)
+        if channel is not None:
+            keep &= self.channel == channel
+        if preamble is not None:
+            keep &= np.isin(self.preamble, [preamble] if isinstance(preamble, str) else list(preamble))
+        if start_ns is not None:
+            keep &= self.times_ns >= start_ns
+            strobes &= self.strobe_ns >= start_ns
+        if end_ns is not None:
+            keep &= self.times_ns < end_ns
+            strobes &= self.strobe_ns < end_ns
+        return Trace(
+            self.kind,
+            self.words[keep],
+            self.times_ns[keep],
+            self.sample_no[keep],
+            self.preamble[keep],
+            self.strobe_ns[strobes],
+            self.strobe_level[strobes],
+        )
+
+    def lines(self):
+        counted = np.flatnonzero(self.sample_no >= 0).tolist()
+        words = self.words.tolist()
+        sample_no = self.sample_no.tolist()
+        if self.kind == "debug":
+            return [subframe_word_string(sample_no[i], words[i]) for i in counted]
+        return [sub_frame_string(sample_no[i], "{:064b}".format(words[i])) for i in counted]
+
+
+def _text_cmd(args):
+    trace = Trace.load(args.in_file).select(args.channel, args.preamble, args.start_ns, args.end_ns)
+    for line in trace.lines():
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tools for binary traces of the subframes seen in the simulator")
+    commands = parser.add_subparsers(required=True)
+
+    text = commands.add_parser("text", help="Print the subframes of a trace in the text format of the tests")
+    text.add_argument("in_file", help="Path to the trace file")
+    text.add_argument("--channel", type=int, choices=[0, 1], help="Only the subframes of this channel")
+    text.add_argument("--preamble", choices=["Z", "X", "Y"], help="Only the subframes with this preamble")
+    text.add_argument("--start-ns", type=int, help="Only the subframes seen at or after this simulated time")
+    text.add_argument("--end-ns", type=int, help="Only the subframes seen before this simulated time")
+    text.set_defaults(func=_text_cmd)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Copyright 2024 XMOS LIMITED.
+# This Software is subject to the terms of the XMOS Public Licence: Version 1.
+
+import pytest
+from Pyxsim import testers
+from pathlib import Path
+from spdif_test_utils import (
+    Clock,
+    Latency_monitor,
+    Loopback_port,
+    sim_cache,
+)
+import json
+
+with open(Path(__file__).parent / "test_loopback/test_params.json") as f:
+    params = json.load(f)
+
+MAX_CYCLES = 100000000
+
+SAM_FREQS = params["SAM_FREQS"]
+CONFIGS = [f"{item['ARCH'].lower()}_{item['CORE_FREQ']}" for item in params["CONFIG"]]
+# Which parametrizations are run at each test level, see spdif_levels.py
+LEVELS = params["LEVELS"]
+
+
+def _get_mclk_freq(sam_freq):
+    if sam_freq in [48000, 96000, 192000]:
+        return 24576000
+    elif sam_freq in [44100, 88200, 176400]:
+        return 22579200
+    else:
+        assert False
+
+
+# The rate the xe reconfigures the transmitter to half way through, which uses the same master clock
+# (see test_loopback/CMakeLists.txt)
+def reconfig_sam_freq(sam_freq):
+    return sam_freq // 4 if sam_freq > 96000 else sam_freq * 2
+
+
+def loopback_cost(config, sam_freq):
+    core_freq = int(config.split("_")[1])
+    # Each segment also waits for the receiver to lock, roughly a block of samples
+    return sum(
+        (params["NO_OF_SAMPLES"] + 192) * core_freq * 1000000 // freq
+        for freq in (sam_freq, reconfig_sam_freq(sam_freq))
+    )
+
+
+#####
+# Measures the latency of samples through spdif_tx and spdif_rx connected together, as in
+# app_spdif_loopback, at each sample rate and after the transmitter is reconfigured to another. The
+# results are recorded for the --latency-report option in conftest.py.
+#####
+@pytest.mark.test_levels(spec=LEVELS["test_loopback_latency"])
+@pytest.mark.cost_estimate(func=loopback_cost)
+@pytest.mark.parametrize("sam_freq", SAM_FREQS)
+@pytest.mark.parametrize("config", CONFIGS)
+def test_loopback_latency(capfd, config, sam_freq):
+    build_config = f"loopback_{config.upper()}_{sam_freq}"
+    xe = str(Path(__file__).parent / f"test_loopback/bin/{build_config}/test_loopback_{build_config}_{build_config}.xe")
+    assert Path(xe).exists(), f"Cannot find {xe}"
+
+    p_spdif_tx = "tile[1]:XS1_PORT_1A"
+    p_spdif_rx = "tile[0]:XS1_PORT_1E"
+    p_mclk = "tile[1]:XS1_PORT_1B"
+    p_tag_out = "tile[1]:XS1_PORT_32A"
+    p_tag_strobe = "tile[1]:XS1_PORT_1C"
+    p_debug_out = "tile[0]:XS1_PORT_32A"
+    p_debug_strobe = "tile[0]:XS1_PORT_1F"
+    no_of_samples = params["NO_OF_SAMPLES"]
+
+    tester = testers.ComparisonTester("PASS")
+    simargs = ["--max-cycles", str(MAX_CYCLES)] + Loopback_port(p_spdif_tx, p_spdif_rx).simargs()
+
+    # The master clock is driven at exactly the nominal frequency, so the receiver sees the nominal
+    # sample rates
+    simthreads = [
+        Clock(p_mclk, _get_mclk_freq(sam_freq) * 2),
+        Latency_monitor(
+            p_tag_out,
+            p_tag_strobe,
+            p_debug_out,
+            p_debug_strobe,
+            [(sam_freq, no_of_samples), (reconfig_sam_freq(sam_freq), no_of_samples)],
+        ),
+    ]
+
+    result = sim_cache.run(
+        xe,
+        simthreads=simthreads,
+        do_xe_prebuild=False,
+        tester=tester,
+        capfd=capfd,
+        timeout=3600,
+        simargs=simargs,
+    )
+    assert result
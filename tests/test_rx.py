@@ -3,7 +3,6 @@
 
 import itertools
 import pytest
-import Pyxsim
 from Pyxsim import testers
 from pathlib import Path
 from spdif_test_utils import (
@@ -12,9 +11,16 @@ from spdif_test_utils import (
     Frames,
     Port_monitor,
     Recorded_stream,
+    Sim_case,
+    Stream_plan,
+    blocks_for_samples,
     freq_for_sample_rate,
+    sim_cache,
+    stream_cache,
 )
+from spdif_streams import synthesize_stream
 import json
+import numpy as np
 
 MAX_CYCLES = 200000000
 pyxsim_timeout = 3600
@@ -25,61 +31,61 @@ MHz = 1000 * KHz
 with open(Path(__file__).parent / "test_rx/test_params.json") as f:
     params = json.load(f)
 
-# When set to 0 the first sub-frame sent is Z the offset can be used to change where in the frame
-# the test starts sending and may help reduce time in the simulator to first Z sub-frame out
-QUICK_START_OFFSET = 0
+# The length of the stream generated for a test, and where in a block it starts, are planned by Stream_plan from
+# the number of samples checked and LOCK_BUDGET_BLOCKS, the blocks the receiver is expected to take to lock. With
+# --plan-from-history the lock time measured when the test last passed (the measured_lock_ns fixture) is used
+# instead, so that the first Z sub-frame arrives soon after lock and no more of the stream is generated than needed
+LOCK_BUDGET_BLOCKS = params["LOCK_BUDGET_BLOCKS"]
 
-# Due to the startup / lock phase there needs to be a long enough stream sent to the sim to so
-# that it can complete the test while still receiving data
-NO_OF_TEST_BLOCKS = 7
+# Port_monitor checks each subframe as it arrives and ends the simulation after this many errors,
+# rather than running a receiver that has lost lock to the end of the test
+MAX_ERRORS = 10
+
+# Number of samples test_rx_lock checks once the receiver has locked
+RX_LOCK_SAMPLES = 4
+
+# test_rx_relock changes between a pair of streams this many times in each direction, each time at a random point in
+# the stream and with a random gap of up to RELOCK_MAX_GAP_NS before the new stream. Only the change between 44100 and
+# 48000 is run at the default test level.
+RELOCK_SWITCHES = 8
+RELOCK_MAX_GAP_NS = 1000000
+RELOCK_SAMPLES = 4
+
+# The builds swept by test_rx_mips_headroom are only made with -DSPDIF_RX_MIPS_SWEEP=ON, which the nightly and
+# exhaustive test levels need. The test is skipped when none of them have been built.
+MIPS_SWEEP = params["MIPS_SWEEP"]
+MIPS_STREAM_TYPES = ["coax", "jitter"]
 
 SAM_FREQS = params["SAM_FREQS"]
+# Which parametrizations of each test are run at each test level, see spdif_levels.py
+LEVELS = params["LEVELS"]
 CONFIGS = [item["ARCH"].lower() for item in params["CONFIG"]]
+CORE_FREQS = {item["ARCH"].lower(): item["CORE_FREQ"] for item in params["CONFIG"]}
 
+# The recorded streams, also checked against this metadata by test_spdif_streams.py
 STREAMS = [
-    Recorded_stream("44100-coax.stream", [["ramp", 5], ["ramp", -7]], 44100, 100 * MHz),
-    Recorded_stream("48000-coax.stream", [["ramp", 5], ["ramp", -7]], 48000, 100 * MHz),
-    Recorded_stream("88200-coax.stream", [["ramp", 5], ["ramp", -7]], 88200, 100 * MHz),
-    Recorded_stream("96000-coax.stream", [["ramp", 5], ["ramp", -7]], 96000, 100 * MHz),
-    Recorded_stream(
-        "176400-coax.stream", [["ramp", 5], ["ramp", -7]], 176400, 100 * MHz
-    ),
-    Recorded_stream(
-        "192000-coax.stream", [["ramp", 5], ["ramp", -7]], 192000, 100 * MHz
-    ),
+    Recorded_stream(item["FILE_NAME"], item["AUDIO"], item["SAM_FREQ"], item["SAMPLE_RATE"])
+    for item in params["STREAMS"]
 ]
 
 
-def rx_uncollect(config, sam_freq, sample_freq_estimate):
-    # Until different test levels are added, only run these tests on xs3
-    if config == "xs2":
-        return True
+# Impairments of the synthesized streams tested by test_rx_synth_stream, see synthesize_stream(). Only "combined" at
+# 48000 is run in the simulator at the smoke and default test levels.
+SYNTH_CONDITIONS = params["SYNTH_CONDITIONS"]
 
-    if sam_freq != sample_freq_estimate:
-        return True
-    return False
+
+def rx_lock_uncollect(config, sam_freq, sample_freq_estimate):
+    # Matching pairs are measured by test_rx
+    return sam_freq == sample_freq_estimate
 
 
 def rx_stream_uncollect(config, stream):
     return False
 
 
-def rx_samfreq_change_uncollect(config, stream0, stream1):
-    def get_target_sam_freq(init_sam_freq, offset):
-        idx = SAM_FREQS.index(init_sam_freq)
-        target_idx = (idx + offset) % len(SAM_FREQS)
-        return SAM_FREQS[target_idx]
-
-    # Until different test levels are added, just run one change per sample rate per board
-    if config == "xs2":
-        target_sam_freq = get_target_sam_freq(stream0.sam_freq, 3)
-        if stream1.sam_freq != target_sam_freq:
-            return True
-    elif config == "xs3":
-        target_sam_freq = get_target_sam_freq(stream0.sam_freq, -1)
-        if stream1.sam_freq != target_sam_freq:
-            return True
-    return False
+# The test levels select recorded streams by their sample rate
+def stream_factors(**params):
+    return {name: value.sam_freq if isinstance(value, Recorded_stream) else value for name, value in params.items()}
 
 
 def _get_duration(sam_freq, sample_freq_estimate):
@@ -89,24 +95,154 @@ def _get_duration(sam_freq, sample_freq_estimate):
         return 10
 
 
+def _get_sim_cycles(config, sam_freq, no_of_samples):
+    # Roughly a block of samples passes before the receiver locks and the checked samples start
+    return (no_of_samples + 192) * CORE_FREQS[config] * MHz // sam_freq
+
+
+def rx_cost(config, sam_freq, sample_freq_estimate):
+    return _get_sim_cycles(config, sam_freq, _get_duration(sam_freq, sample_freq_estimate))
+
+
+def rx_lock_cost(config, sam_freq, sample_freq_estimate):
+    # The receiver may try every other rate before finding this one
+    return len(SAM_FREQS) * _get_sim_cycles(config, sam_freq, RX_LOCK_SAMPLES)
+
+
+def rx_stream_cost(config, stream):
+    return _get_sim_cycles(config, stream.sam_freq, 192)
+
+
+def rx_synth_cost(config, sam_freq, condition):
+    return _get_sim_cycles(config, sam_freq, 192)
+
+
+def rx_relock_cost(config, stream0, stream1):
+    # Each change waits for the gap, the receiver to lock and up to a block for the first Z
+    gap_samples = RELOCK_MAX_GAP_NS // 2 * stream0.sam_freq // 1000000000
+    return RELOCK_SWITCHES * sum(
+        _get_sim_cycles(config, stream.sam_freq, gap_samples + 192 + RELOCK_SAMPLES) for stream in (stream0, stream1)
+    )
+
+
+def rx_mips_cost(config, sam_freq, stream_type):
+    # A binary search over the sweep, each run taking at most as long as at the highest core frequency
+    runs = len(_mips_sweep_points()).bit_length()
+    return runs * (192 + 192) * max(MIPS_SWEEP["CORE_FREQS"]) * MHz // sam_freq
+
+
+def rx_samfreq_change_cost(config, stream0, stream1):
+    return _get_sim_cycles(config, stream0.sam_freq, 192) + _get_sim_cycles(
+        config, stream1.sam_freq, 192 + 16
+    )
+
+
+# The MIPS available to each thread when the receiver, the thread passing its samples out and the dummy threads
+# are all running. A thread gets at most one instruction in five cycles however few threads are running.
+def _mips_per_thread(core_freq, dthreads):
+    return core_freq / max(5, 2 + dthreads)
+
+
+# The (mips, core_freq, dthreads) points swept, lowest MIPS first. Where several give the same MIPS the one with
+# the most dummy threads is kept, as that is nearest to a fully loaded application.
+def _mips_sweep_points():
+    points = {}
+    for core_freq in MIPS_SWEEP["CORE_FREQS"]:
+        for dthreads in MIPS_SWEEP["DTHREADS"]:
+            mips = _mips_per_thread(core_freq, dthreads)
+            if mips not in points or dthreads > points[mips][1]:
+                points[mips] = (core_freq, dthreads)
+    return [(mips, *points[mips]) for mips in sorted(points)]
+
+
+def _rx_xe(config, sam_freq):
+    build_config = f"rx_{config.upper()}_{300}_{sam_freq}"
+    return str(Path(__file__).parent / f"test_rx/bin/{build_config}/test_rx_{build_config}_{build_config}.xe")
+
+
+# test_rx_stream and test_rx_samfreq_change run in batches with --batch-sims, see Sim_batches in conftest.py
+def rx_stream_case(config, stream):
+    return Sim_case(_rx_xe(config, stream.sam_freq), [stream])
+
+
+def rx_samfreq_change_case(config, stream0, stream1):
+    return Sim_case(_rx_xe(config, stream0.sam_freq), [stream0, stream1])
+
+
+#####
+# Plays a list of recorded streams to the receiver one after another in one simulation, checking 192 samples of each
+#####
+# The gap with no signal before each change of stream, up to RELOCK_MAX_GAP_NS. Each change between the same pair
+# of sample rates gets the same gap, so a test of a change simulates the same signal on its own or in a batch.
+def change_gaps_ns(streams):
+    return [
+        int(np.random.default_rng([stream0.sam_freq, stream1.sam_freq]).integers(0, RELOCK_MAX_GAP_NS))
+        for stream0, stream1 in zip(streams, streams[1:])
+    ]
+
+
+def run_rx_batch(xe, streams, capfd):
+    assert Path(xe).exists(), f"Cannot find {xe}"
+
+    p_spdif_in = "tile[0]:XS1_PORT_1E"
+    p_debug_out = "tile[0]:XS1_PORT_32A"
+    p_debug_strobe = "tile[0]:XS1_PORT_1F"
+
+    no_of_samples = 192
+
+    stream_dir = Path(__file__).parent / "test_rx" / "streams"
+    data = {stream.file_name: stream.load(stream_dir) for stream in streams}
+    frames = [
+        Frames(channels=stream.audio, no_of_blocks=blocks_for_samples(no_of_samples), sam_freq=stream.sam_freq)
+        for stream in streams
+    ]
+
+    tester = testers.ComparisonTester("PASS")
+
+    thr_tx = Spdif_tx(
+        p_spdif_in,
+        [Spdif_tx_stream(data[stream.file_name], stream.sample_rate) for stream in streams],
+        gaps_ns=change_gaps_ns(streams),
+    )
+    thr_pm = Port_monitor(
+        p_debug_out,
+        p_debug_strobe,
+        no_of_samples,
+        spdif_tx=thr_tx,
+        check_frames=frames,
+        max_errors=MAX_ERRORS,
+    )
+
+    simargs = ["--max-cycles", str(MAX_CYCLES * len(streams))]
+
+    return sim_cache.run(
+        xe,
+        simthreads=[thr_tx, thr_pm],
+        do_xe_prebuild=False,
+        tester=tester,
+        capfd=capfd,
+        timeout=pyxsim_timeout,
+        simargs=simargs,
+    )
+
+
 def param_id(val):
     if isinstance(val, Recorded_stream):
-        # Use the stream filename as the pytest ID but remove the ".stream" extension
-        name = val.file_name
-        if name.endswith(".stream"):
-            name = name[: -len(".stream")]
-        return name
+        # Use the stream filename as the pytest ID but remove the extension
+        return Path(val.file_name).stem
 
 
 #####
 # This test checks the receiver running in the simulator by providing it with a "perfect" signal at different sample rates,
-# with different expected sample rates
+# with different expected sample rates. The xe is built for sam_freq, so every level only runs sample_freq_estimate
+# equal to it; test_rx_lock builds for the estimate to test the mismatches.
 #####
-@pytest.mark.uncollect_if(func=rx_uncollect)
+@pytest.mark.test_levels(spec=LEVELS["test_rx"])
+@pytest.mark.cost_estimate(func=rx_cost)
 @pytest.mark.parametrize("sample_freq_estimate", SAM_FREQS)
 @pytest.mark.parametrize("sam_freq", SAM_FREQS)
 @pytest.mark.parametrize("config", CONFIGS)
-def test_rx(capfd, config, sam_freq, sample_freq_estimate):
+def test_rx(capfd, measured_lock_ns, config, sam_freq, sample_freq_estimate):
     # time taken in the simulator to correct frequency currently too long for tests. Re-enable sample rate mismatch once resolved
     # sample_freq_estimate = sam_freq
 
@@ -124,8 +260,9 @@ def test_rx(capfd, config, sam_freq, sample_freq_estimate):
         ["ramp", 5],
     ]
 
-    frames = Frames(channels=audio, no_of_blocks=NO_OF_TEST_BLOCKS, sam_freq=sam_freq)
-    out = frames.stream(quick_start_offset=QUICK_START_OFFSET)
+    plan = Stream_plan(sam_freq, no_of_samples, lock_ns=measured_lock_ns, lock_budget_blocks=LOCK_BUDGET_BLOCKS)
+    frames = Frames(channels=audio, no_of_blocks=plan.no_of_blocks, sam_freq=sam_freq)
+    out = stream_cache.stream(frames, quick_start_offset=plan.quick_start_offset)
 
     stream = [
         Spdif_tx_stream(out, freq_for_sample_rate(sam_freq)),
@@ -134,12 +271,18 @@ def test_rx(capfd, config, sam_freq, sample_freq_estimate):
     tester = testers.ComparisonTester("PASS")
     simthreads = [
         Spdif_tx(p_spdif_in, stream),
-        Port_monitor(p_debug_out, p_debug_strobe, no_of_samples, check_frames=[frames]),
+        Port_monitor(
+            p_debug_out,
+            p_debug_strobe,
+            no_of_samples,
+            check_frames=[frames],
+            max_errors=MAX_ERRORS,
+        ),
     ]
 
     simargs = ["--max-cycles", str(MAX_CYCLES)]
 
-    result = Pyxsim.run_on_simulator_(
+    result = sim_cache.run(
         xe,
         simthreads=simthreads,
         tester=tester,
@@ -151,13 +294,297 @@ def test_rx(capfd, config, sam_freq, sample_freq_estimate):
     assert result
 
 
+#####
+# Measures how long the receiver takes to lock when its sample rate estimate is wrong. Every test of the receiver
+# records its lock time, see the --lock-report option in conftest.py.
+#####
+@pytest.mark.uncollect_if(func=rx_lock_uncollect)
+@pytest.mark.test_levels(spec=LEVELS["test_rx_lock"])
+@pytest.mark.cost_estimate(func=rx_lock_cost)
+@pytest.mark.parametrize("sample_freq_estimate", SAM_FREQS)
+@pytest.mark.parametrize("sam_freq", SAM_FREQS)
+@pytest.mark.parametrize("config", CONFIGS)
+def test_rx_lock(capfd, measured_lock_ns, config, sam_freq, sample_freq_estimate):
+    # The xe is built for its sample rate estimate
+    build_config = f"rx_{config.upper()}_{300}_{sample_freq_estimate}"
+    xe = str(Path(__file__).parent / f"test_rx/bin/{build_config}/test_rx_{build_config}_{build_config}.xe")
+    assert Path(xe).exists(), f"Cannot find {xe}"
+
+    p_spdif_in = "tile[0]:XS1_PORT_1E"
+    p_debug_out = "tile[0]:XS1_PORT_32A"
+    p_debug_strobe = "tile[0]:XS1_PORT_1F"
+
+    no_of_samples = RX_LOCK_SAMPLES
+
+    audio = [
+        ["ramp", -7],
+        ["ramp", 5],
+    ]
+
+    plan = Stream_plan(sam_freq, no_of_samples, lock_ns=measured_lock_ns, lock_budget_blocks=LOCK_BUDGET_BLOCKS)
+    frames = Frames(channels=audio, no_of_blocks=plan.no_of_blocks, sam_freq=sam_freq)
+    out = stream_cache.stream(frames, quick_start_offset=plan.quick_start_offset)
+
+    stream = [
+        Spdif_tx_stream(out, freq_for_sample_rate(sam_freq)),
+    ]
+
+    tester = testers.ComparisonTester("PASS")
+    simthreads = [
+        Spdif_tx(p_spdif_in, stream),
+        Port_monitor(
+            p_debug_out,
+            p_debug_strobe,
+            no_of_samples,
+            check_frames=[frames],
+            max_errors=MAX_ERRORS,
+        ),
+    ]
+
+    simargs = ["--max-cycles", str(MAX_CYCLES)]
+
+    result = sim_cache.run(
+        xe,
+        simthreads=simthreads,
+        tester=tester,
+        capfd=capfd,
+        timeout=pyxsim_timeout,
+        simargs=simargs,
+        do_xe_prebuild=False
+    )
+    assert result
+
+
+#####
+# Measures how long the receiver takes to relock when the stream changes between a pair of recorded streams. The
+# stream changes back and forth RELOCK_SWITCHES times in each direction, at random (but repeatable) points in the
+# stream and with random gaps in between, and the samples received after each change are checked. The relock times
+# are recorded for the --relock-report option in conftest.py.
+#####
+@pytest.mark.test_levels(spec=LEVELS["test_rx_relock"], factors=stream_factors)
+@pytest.mark.cost_estimate(func=rx_relock_cost)
+@pytest.mark.parametrize(
+    ("stream0", "stream1"), itertools.combinations(STREAMS, 2), ids=param_id
+)
+@pytest.mark.parametrize("config", CONFIGS)
+def test_rx_relock(config, stream0, stream1, capfd):
+    build_config = f"rx_{config.upper()}_{300}_{stream0.sam_freq}"
+    xe = str(Path(__file__).parent / f"test_rx/bin/{build_config}/test_rx_{build_config}_{build_config}.xe")
+    assert Path(xe).exists(), f"Cannot find {xe}"
+
+    p_spdif_in = "tile[0]:XS1_PORT_1E"
+    p_debug_out = "tile[0]:XS1_PORT_32A"
+    p_debug_strobe = "tile[0]:XS1_PORT_1F"
+
+    no_of_samples = RELOCK_SAMPLES
+
+    stream_dir = Path(__file__).parent / "test_rx" / "streams"
+    out0 = stream0.load(stream_dir)
+    out1 = stream1.load(stream_dir)
+
+    # Starting and ending on stream0 changes the stream RELOCK_SWITCHES times each way
+    pairs = [stream0, stream1] * RELOCK_SWITCHES + [stream0]
+    streams = [
+        Spdif_tx_stream(out0 if stream is stream0 else out1, stream.sample_rate) for stream in pairs
+    ]
+    # The initial values of the samples are logged for each stream, so each needs its own Frames
+    frames = [
+        Frames(channels=stream.audio, no_of_blocks=blocks_for_samples(no_of_samples), sam_freq=stream.sam_freq)
+        for stream in pairs
+    ]
+
+    rng = np.random.default_rng([stream0.sam_freq, stream1.sam_freq])
+    # Anywhere in a block of subframes
+    switch_subframes = rng.integers(0, 2 * 192, len(pairs) - 1).tolist()
+    gaps_ns = rng.integers(0, RELOCK_MAX_GAP_NS, len(pairs) - 1).tolist()
+
+    tester = testers.ComparisonTester("PASS")
+
+    thr_tx = Spdif_tx(p_spdif_in, streams, gaps_ns=gaps_ns)
+    thr_pm = Port_monitor(
+        p_debug_out,
+        p_debug_strobe,
+        no_of_samples,
+        spdif_tx=thr_tx,
+        check_frames=frames,
+        max_errors=MAX_ERRORS,
+        switch_subframes=switch_subframes,
+    )
+
+    simargs = ["--max-cycles", str(MAX_CYCLES)]
+
+    result = sim_cache.run(
+        xe,
+        simthreads=[thr_tx, thr_pm],
+        do_xe_prebuild=False,
+        tester=tester,
+        capfd=capfd,
+        timeout=pyxsim_timeout,
+        simargs=simargs,
+    )
+    assert result
+
+
+#####
+# Finds the fewest MIPS per thread at which the receiver still decodes a recorded stream without errors, by
+# sweeping the core frequency and number of dummy threads, so the headroom of the receiver can be tracked over
+# time. Assumes that a point that passes is passed by every point with more MIPS, so only the points of a
+# binary search are run. The result is recorded for the --mips-report option in conftest.py.
+#####
+@pytest.mark.test_levels(spec=LEVELS["test_rx_mips_headroom"])
+@pytest.mark.cost_estimate(func=rx_mips_cost)
+@pytest.mark.parametrize("stream_type", MIPS_STREAM_TYPES)
+@pytest.mark.parametrize("sam_freq", SAM_FREQS)
+@pytest.mark.parametrize("config", CONFIGS)
+def test_rx_mips_headroom(capfd, record_property, config, sam_freq, stream_type):
+    p_spdif_in = "tile[0]:XS1_PORT_1E"
+    p_debug_out = "tile[0]:XS1_PORT_32A"
+    p_debug_strobe = "tile[0]:XS1_PORT_1F"
+
+    no_of_samples = 192
+
+    stream = Recorded_stream(
+        f"{sam_freq}-{stream_type}.rle", [["ramp", 5], ["ramp", -7]], sam_freq, 100 * MHz
+    )
+    out = stream.load(Path(__file__).parent / "test_rx" / "streams")
+    frames = Frames(
+        channels=stream.audio, no_of_blocks=blocks_for_samples(no_of_samples), sam_freq=sam_freq
+    )
+
+    def mips_xe(core_freq, dthreads):
+        build_config = f"rx_mips_{config.upper()}_{core_freq}_{dthreads}_{sam_freq}"
+        return Path(__file__).parent / f"test_rx/bin/{build_config}/test_rx_{build_config}_{build_config}.xe"
+
+    if not any(mips_xe(core_freq, dthreads).exists() for _, core_freq, dthreads in _mips_sweep_points()):
+        pytest.skip("The MIPS sweep builds are only made when configured with -DSPDIF_RX_MIPS_SWEEP=ON")
+
+    def run(core_freq, dthreads):
+        xe = str(mips_xe(core_freq, dthreads))
+        assert Path(xe).exists(), f"Cannot find {xe}"
+
+        tester = testers.ComparisonTester("PASS")
+        simthreads = [
+            Spdif_tx(p_spdif_in, [Spdif_tx_stream(out, stream.sample_rate)]),
+            Port_monitor(
+                p_debug_out,
+                p_debug_strobe,
+                no_of_samples,
+                check_frames=[frames],
+                max_errors=MAX_ERRORS,
+            ),
+        ]
+
+        simargs = ["--max-cycles", str(MAX_CYCLES)]
+
+        return sim_cache.run(
+            xe,
+            simthreads=simthreads,
+            do_xe_prebuild=False,
+            tester=tester,
+            capfd=capfd,
+            timeout=pyxsim_timeout,
+            simargs=simargs,
+        )
+
+    points = _mips_sweep_points()
+    lowest_pass = None
+    low, high = 0, len(points) - 1
+    while low <= high:
+        mid = (low + high) // 2
+        _, core_freq, dthreads = points[mid]
+        if run(core_freq, dthreads):
+            lowest_pass = mid
+            high = mid - 1
+        else:
+            low = mid + 1
+
+    # test_rx runs at 300 MHz with no dummy threads
+    rx_mips = _mips_per_thread(CORE_FREQS[config], 0)
+    if lowest_pass is None:
+        result = {"min_mips": None, "core_freq": None, "dthreads": None, "headroom_mips": None}
+    else:
+        mips, core_freq, dthreads = points[lowest_pass]
+        result = {"min_mips": mips, "core_freq": core_freq, "dthreads": dthreads, "headroom_mips": rx_mips - mips}
+    record_property("mips_headroom", result)
+
+    assert lowest_pass is not None, f"No error free point in the MIPS sweep for {stream.file_name}"
+
+
+#####
+# Tests the receiver against over sampled streams synthesized with impairments to the timing of their edges
+#####
+@pytest.mark.test_levels(spec=LEVELS["test_rx_synth_stream"])
+@pytest.mark.cost_estimate(func=rx_synth_cost)
+@pytest.mark.parametrize("condition", SYNTH_CONDITIONS)
+@pytest.mark.parametrize("sam_freq", SAM_FREQS)
+@pytest.mark.parametrize("config", CONFIGS)
+def test_rx_synth_stream(capfd, measured_lock_ns, config, sam_freq, condition):
+    build_config = f"rx_{config.upper()}_{300}_{sam_freq}"
+    xe = str(Path(__file__).parent / f"test_rx/bin/{build_config}/test_rx_{build_config}_{build_config}.xe")
+    assert Path(xe).exists(), f"Cannot find {xe}"
+
+    p_spdif_in = "tile[0]:XS1_PORT_1E"
+    p_debug_out = "tile[0]:XS1_PORT_32A"
+    p_debug_strobe = "tile[0]:XS1_PORT_1F"
+
+    no_of_samples = 192
+
+    audio = [
+        ["ramp", 5],
+        ["ramp", -7],
+    ]
+
+    plan = Stream_plan(sam_freq, no_of_samples, lock_ns=measured_lock_ns, lock_budget_blocks=LOCK_BUDGET_BLOCKS)
+    frames = Frames(channels=audio, no_of_blocks=plan.no_of_blocks, sam_freq=sam_freq)
+    out = synthesize_stream(
+        stream_cache.stream(frames, quick_start_offset=plan.quick_start_offset),
+        sam_freq,
+        **SYNTH_CONDITIONS[condition],
+    )
+
+    streams = [
+        Spdif_tx_stream(out, out.capture_clock),
+    ]
+
+    tester = testers.ComparisonTester("PASS")
+
+    simthreads = [
+        Spdif_tx(p_spdif_in, streams),
+        Port_monitor(
+            p_debug_out,
+            p_debug_strobe,
+            no_of_samples,
+            check_frames=[frames],
+            max_errors=MAX_ERRORS,
+        ),
+    ]
+
+    simargs = ["--max-cycles", str(MAX_CYCLES)]
+
+    result = sim_cache.run(
+        xe,
+        simthreads=simthreads,
+        do_xe_prebuild=False,
+        tester=tester,
+        capfd=capfd,
+        timeout=pyxsim_timeout,
+        simargs=simargs,
+    )
+    assert result
+
+
 #####
 # Tests the receiver against over sampled bit representations of real world spdif streams
 #####
 @pytest.mark.uncollect_if(func=rx_stream_uncollect)
+@pytest.mark.test_levels(spec=LEVELS["test_rx_stream"], factors=stream_factors)
+@pytest.mark.cost_estimate(func=rx_stream_cost)
+@pytest.mark.sim_batch(case=rx_stream_case, run=run_rx_batch)
 @pytest.mark.parametrize("stream", STREAMS, ids=param_id)
 @pytest.mark.parametrize("config", CONFIGS)
-def test_rx_stream(config, stream, capfd):
+def test_rx_stream(config, stream, capfd, sim_batch_passed):
+    if sim_batch_passed():
+        return
 
     build_config = f"rx_{config.upper()}_{300}_{stream.sam_freq}"
     xe = str(Path(__file__).parent / f"test_rx/bin/{build_config}/test_rx_{build_config}_{build_config}.xe")
@@ -170,12 +597,11 @@ def test_rx_stream(config, stream, capfd):
     no_of_samples = 192
 
     frames = Frames(
-        channels=stream.audio, no_of_blocks=NO_OF_TEST_BLOCKS, sam_freq=stream.sam_freq
+        channels=stream.audio, no_of_blocks=blocks_for_samples(no_of_samples), sam_freq=stream.sam_freq
     )
 
     stream_dir = Path(__file__).parent / "test_rx" / "streams"
-    with open(stream_dir / stream.file_name, "rb") as f:
-        out = f.read()
+    out = stream.load(stream_dir)
 
     streams = [
         Spdif_tx_stream(out, stream.sample_rate),
@@ -185,12 +611,18 @@ def test_rx_stream(config, stream, capfd):
 
     simthreads = [
         Spdif_tx(p_spdif_in, streams),
-        Port_monitor(p_debug_out, p_debug_strobe, no_of_samples, check_frames=[frames]),
+        Port_monitor(
+            p_debug_out,
+            p_debug_strobe,
+            no_of_samples,
+            check_frames=[frames],
+            max_errors=MAX_ERRORS,
+        ),
     ]
 
     simargs = ["--max-cycles", str(MAX_CYCLES)]
 
-    result = Pyxsim.run_on_simulator_(
+    result = sim_cache.run(
         xe,
         simthreads=simthreads,
         do_xe_prebuild=False,
@@ -205,12 +637,16 @@ def test_rx_stream(config, stream, capfd):
 #####
 # Tests the receiver with a change of sample rate between a pair of recorded streams
 #####
-@pytest.mark.uncollect_if(func=rx_samfreq_change_uncollect)
+@pytest.mark.test_levels(spec=LEVELS["test_rx_samfreq_change"], factors=stream_factors)
+@pytest.mark.cost_estimate(func=rx_samfreq_change_cost)
+@pytest.mark.sim_batch(case=rx_samfreq_change_case, run=run_rx_batch)
 @pytest.mark.parametrize(
     ("stream0", "stream1"), itertools.permutations(STREAMS, 2), ids=param_id
 )
 @pytest.mark.parametrize("config", CONFIGS)
-def test_rx_samfreq_change(config, stream0, stream1, capfd):
+def test_rx_samfreq_change(config, stream0, stream1, capfd, sim_batch_passed):
+    if sim_batch_passed():
+        return
     build_config = f"rx_{config.upper()}_{300}_{stream0.sam_freq}"
     xe = str(Path(__file__).parent / f"test_rx/bin/{build_config}/test_rx_{build_config}_{build_config}.xe")
     assert Path(xe).exists(), f"Cannot find {xe}"
@@ -224,23 +660,19 @@ def test_rx_samfreq_change(config, stream0, stream1, capfd):
     frames = [
         Frames(
             channels=stream0.audio,
-            no_of_blocks=NO_OF_TEST_BLOCKS,
+            no_of_blocks=blocks_for_samples(no_of_samples),
             sam_freq=stream0.sam_freq,
         ),
         Frames(
             channels=stream1.audio,
-            no_of_blocks=NO_OF_TEST_BLOCKS,
+            no_of_blocks=blocks_for_samples(no_of_samples),
             sam_freq=stream1.sam_freq,
         ),
     ]
 
     stream_dir = Path(__file__).parent / "test_rx" / "streams"
-
-    with open(stream_dir / stream0.file_name, "rb") as f:
-        out0 = f.read()
-
-    with open(stream_dir / stream1.file_name, "rb") as f:
-        out1 = f.read()
+    out0 = stream0.load(stream_dir)
+    out1 = stream1.load(stream_dir)
 
     streams = [
         Spdif_tx_stream(out0, stream0.sample_rate),
@@ -249,7 +681,7 @@ def test_rx_samfreq_change(config, stream0, stream1, capfd):
 
     tester = testers.ComparisonTester("PASS")
 
-    thr_tx = Spdif_tx(p_spdif_in, streams)
+    thr_tx = Spdif_tx(p_spdif_in, streams, gaps_ns=change_gaps_ns([stream0, stream1]))
     thr_pm = Port_monitor(
         p_debug_out,
         p_debug_strobe,
@@ -257,6 +689,7 @@ def test_rx_samfreq_change(config, stream0, stream1, capfd):
         spdif_tx=thr_tx,
         print_frame=False,
         check_frames=frames,
+        max_errors=MAX_ERRORS,
     )
 
     simthreads = [
@@ -266,7 +699,7 @@ def test_rx_samfreq_change(config, stream0, stream1, capfd):
 
     simargs = ["--max-cycles", str(MAX_CYCLES)]
 
-    result = Pyxsim.run_on_simulator_(
+    result = sim_cache.run(
         xe,
         simthreads=simthreads,
         do_xe_prebuild=False,
@@ -0,0 +1,137 @@
+# Copyright 2024 XMOS LIMITED.
+# This Software is subject to the terms of the XMOS Public Licence: Version 1.
+
+#####
+# Tests of the signal sources and Frames in spdif_frames.py, which only need NumPy so run without the simulator
+#####
+
+import wave
+import numpy as np
+import pytest
+from spdif_frames import FULL_SCALE, Audio_func, Frames, Stream_cache
+
+SAM_FREQ = 48000
+
+
+def _write_wav(path, width, frames):
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(len(frames[0]))
+        f.setsampwidth(width)
+        f.setframerate(SAM_FREQ)
+        f.writeframes(
+            b"".join(
+                int(value).to_bytes(width, "little", signed=width > 1) for frame in frames for value in frame
+            )
+        )
+
+
+def test_sine_values():
+    # A quarter of the sample rate gives the peaks and zero crossings at whole samples
+    func = Audio_func("sine", SAM_FREQ // 4, 0.5, sam_freq=SAM_FREQ)
+    half_scale = round(FULL_SCALE / 2)
+    assert func.samples(0, 8).tolist() == [0, half_scale, 0, -half_scale] * 2
+    assert func.block(0, 1).tolist() == func.samples(0, 192, 192).tolist()
+
+
+def test_square_values():
+    func = Audio_func("square", SAM_FREQ // 8, sam_freq=SAM_FREQ)
+    high, low = FULL_SCALE, -FULL_SCALE - 1
+    assert func.samples(0, 8, 2).tolist() == [high, high, low, low, low, low, high, high]
+
+
+def test_array_values():
+    func = Audio_func("array", [3, -2, 7])
+    assert func.samples(0, 7, 1).tolist() == [-2, 7, 3, -2, 7, 3, -2]
+    assert func.at([5, 0]).tolist() == [7, 3]
+
+
+def test_noise_values():
+    values = Audio_func("noise", 1234).samples(0, 192 * 4)
+    assert values.min() >= -(1 << 23) and values.max() <= FULL_SCALE
+    # The same seed gives the same values, whichever samples are generated at a time
+    assert np.array_equal(Audio_func("noise", 1234).block(0, 2), values[384:576])
+    assert not np.array_equal(Audio_func("noise", 1235).samples(0, 192 * 4), values)
+    assert np.array_equal(Audio_func("noise", 1234, 0.5).samples(0, 192 * 4), np.round(values * 0.5))
+
+
+@pytest.mark.parametrize("seed", [-1, 1 << 64])
+def test_noise_seed_range(seed):
+    with pytest.raises(Exception, match="Noise seed"):
+        Audio_func("noise", seed)
+
+
+@pytest.mark.parametrize(
+    "width, values, expected",
+    [
+        (1, [0, 128, 255], [-128 << 16, 0, 127 << 16]),
+        (2, [-32768, 0, 32767], [-32768 << 8, 0, 32767 << 8]),
+        (3, [-(1 << 23), 1, FULL_SCALE], [-(1 << 23), 1, FULL_SCALE]),
+    ],
+)
+def test_wav_scaling(tmp_path, width, values, expected):
+    path = tmp_path / f"{width * 8}bit.wav"
+    # The second channel is the negated first, so reading the wrong one shows
+    other = [255 - value if width == 1 else -1 - value for value in values]
+    _write_wav(path, width, list(zip(values, other)))
+    assert Audio_func("wav", path).samples(0, 4).tolist() == expected + expected[:1]
+    shift = 24 - 8 * width
+    expected = [(-1 - (value >> shift)) << shift for value in expected]
+    assert Audio_func("wav", path, 1).samples(0, 3).tolist() == expected
+
+
+@pytest.mark.parametrize(
+    "audio",
+    [
+        [["sine", 1100, 0.9], ["noise", 99]],
+        [["array", list(range(500))], ["square", 3000]],
+    ],
+    ids=["sine-noise", "array-square"],
+)
+def test_words_match_iter_words(audio):
+    frames = Frames(channels=audio, no_of_blocks=3, sam_freq=SAM_FREQ)
+    # Start the expected signal from the second block, so the sample numbers wrap before the end of the frames
+    for func in frames._funcs:
+        frames.log_initial_value(int(func.block(0, 1)[0]))
+    words = frames.words()
+    assert words.tolist() == list(frames.iter_words())
+    unlogged = Frames(channels=audio, no_of_blocks=3, sam_freq=SAM_FREQ)
+    assert np.array_equal(words[: 2 * 384], unlogged.words()[384:])
+
+
+def test_description():
+    audio = [["ramp", 5], ["array", [1, 2, 3]]]
+    frames = Frames(channels=audio, no_of_blocks=2, sam_freq=SAM_FREQ)
+    description = frames.description()
+    assert description == Frames(channels=audio, no_of_blocks=2, sam_freq=SAM_FREQ).description()
+    assert description["frames"]["no_of_blocks"] == 2
+    assert description["audio"][0] == ["ramp", 5]
+    # Arrays are identified by their content
+    assert description["audio"][1][0] == "array"
+    other = Frames(channels=[["ramp", 5], ["array", [1, 2, 4]]], no_of_blocks=2, sam_freq=SAM_FREQ)
+    assert other.description()["audio"][1] != description["audio"][1]
+    frames.log_initial_value(7)
+    assert frames.description()["initial_values"] == [7]
+    assert frames.description() != description
+
+
+def test_stream_cache(tmp_path):
+    frames = Frames(channels=[["ramp", 5], ["ramp", -7]], no_of_blocks=1, sam_freq=SAM_FREQ)
+    cache = Stream_cache(tmp_path)
+    assert cache.stream(frames) == frames.stream()
+    assert cache.expect(frames) == frames.expect()
+    # A new cache on the same directory finds the entries, and other arguments are separate entries
+    other = Stream_cache(tmp_path)
+    assert other.stream(frames) == frames.stream()
+    assert other.expect(frames) == frames.expect()
+    assert other.stream(frames, quick_start_offset=2) == frames.stream(quick_start_offset=2)
+    assert (cache.stats(), other.stats()) == ({"hits": 0, "misses": 2}, {"hits": 2, "misses": 1})
+    assert len(list(tmp_path.iterdir())) == 3
+
+
+def test_stream_cache_eviction(tmp_path):
+    cache = Stream_cache(tmp_path, max_bytes=1)
+    frames = Frames(channels=[["ramp", 5], ["ramp", -7]], no_of_blocks=1, sam_freq=SAM_FREQ)
+    cache.stream(frames)
+    cache.stream(frames)
+    assert cache.stats() == {"hits": 0, "misses": 2}
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,88 @@
+# Copyright 2024 XMOS LIMITED.
+# This Software is subject to the terms of the XMOS Public Licence: Version 1.
+
+#####
+# Tests of the stream files and the tools in spdif_streams.py, which only need NumPy so run without the simulator
+#####
+
+import json
+from pathlib import Path
+import numpy as np
+import pytest
+from spdif_frames import Frames, Stream_cache
+from spdif_streams import Compact_stream, Recorded_stream, channel_status_sam_freq, decode_stream, synthesize_stream
+
+with open(Path(__file__).parent / "test_rx/test_params.json") as f:
+    params = json.load(f)
+
+STREAM_DIR = Path(__file__).parent / "test_rx" / "streams"
+STREAMS = [
+    Recorded_stream(item["FILE_NAME"], item["AUDIO"], item["SAM_FREQ"], item["SAMPLE_RATE"])
+    for item in params["STREAMS"]
+]
+SAM_FREQS = params["SAM_FREQS"]
+# The recordings of a jittery source, as played to the receiver by test_rx_mips_headroom
+JITTER_STREAMS = [
+    Recorded_stream(f"{sam_freq}-jitter.rle", [["ramp", 5], ["ramp", -7]], sam_freq, 100000000) for sam_freq in SAM_FREQS
+]
+SYNTH_CONDITIONS = params["SYNTH_CONDITIONS"]
+
+
+def param_id(val):
+    if isinstance(val, Recorded_stream):
+        # Use the stream filename as the pytest ID but remove the extension
+        return Path(val.file_name).stem
+
+
+#####
+# Checks the recorded streams contain what their Recorded_stream metadata describes
+#####
+@pytest.mark.parametrize("stream", STREAMS, ids=param_id)
+def test_rx_stream_metadata(stream):
+    data = stream.load(STREAM_DIR)
+    if isinstance(data, Compact_stream):
+        assert data.sam_freq == stream.sam_freq
+        assert data.capture_clock == stream.sample_rate
+
+    decoded = decode_stream(data, stream.sample_rate)
+    assert not decoded.coding_errors.any()
+    assert round(decoded.sam_freq_estimate / stream.sam_freq, 2) == 1.0
+    assert channel_status_sam_freq(decoded.channel_status_blocks()[0]) == stream.sam_freq
+
+    for chan, (func, value) in zip(decoded.channels(), stream.audio):
+        assert not chan.parity_error.any()
+        assert func == "ramp"
+        assert np.all((np.diff(chan.audio) & 0xFFFFFF) == (value & 0xFFFFFF))
+
+
+#####
+# Checks that the jitter on the recorded jittery streams is not taken for errors on the line. The 48000 recording also
+# has glitches shorter than half a UI, which can break the subframes they are in, but should break no others.
+#####
+@pytest.mark.parametrize("stream", JITTER_STREAMS, ids=param_id)
+def test_jitter_stream_decodes(stream):
+    data = stream.load(STREAM_DIR)
+    decoded = decode_stream(data, stream.sample_rate)
+    glitches = np.count_nonzero(np.diff(data.edges()[1:]) < decoded.ui / 2)
+    channels = decoded.channels()
+    errors = np.count_nonzero(decoded.coding_errors) + sum(np.count_nonzero(chan.parity_error) for chan in channels)
+    assert errors <= glitches
+    assert round(decoded.sam_freq_estimate / stream.sam_freq, 2) == 1.0
+    if glitches == 0:
+        for chan, (func, value) in zip(channels, stream.audio):
+            assert np.all((np.diff(chan.audio) & 0xFFFFFF) == (value & 0xFFFFFF))
+
+
+#####
+# Checks that the synthesized streams decode to the Frames they were made from
+#####
+@pytest.mark.parametrize("condition", SYNTH_CONDITIONS)
+@pytest.mark.parametrize("sam_freq", SAM_FREQS)
+def test_synth_stream_decodes(tmp_path, sam_freq, condition):
+    frames = Frames(channels=[["ramp", 5], ["ramp", -7]], no_of_blocks=2, sam_freq=sam_freq)
+    data = synthesize_stream(Stream_cache(tmp_path).stream(frames), sam_freq, **SYNTH_CONDITIONS[condition])
+
+    decoded = decode_stream(data, data.capture_clock)
+    assert len(decoded.words) > 0
+    assert not decoded.coding_errors.any()
+    assert np.array_equal(decoded.words, frames.words()[: len(decoded.words)])
@@ -1,8 +1,8 @@
 # Copyright 2014-2024 XMOS LIMITED.
 # This Software is subject to the terms of the XMOS Public Licence: Version 1.
 
+import os
 import pytest
-import Pyxsim
 from Pyxsim import testers
 from pathlib import Path
 from spdif_test_utils import (
@@ -10,6 +10,8 @@ from spdif_test_utils import (
     Spdif_rx,
     Frames,
     freq_for_sample_rate,
+    sim_cache,
+    stream_cache,
 )
 import json
 
@@ -20,6 +22,15 @@ MAX_CYCLES = 15000000
 
 SAM_FREQS = params["SAM_FREQS"]
 CONFIGS = [f"{item['ARCH'].lower()}_{item['CORE_FREQ']}" for item in params["CONFIG"]]
+# Which parametrizations are run at each test level, see spdif_levels.py. The default level runs the configs with
+# the lowest core clocks, which leave the transmitter the least time per output.
+LEVELS = params["LEVELS"]
+
+# Worst difference in UI allowed between an edge output by the transmitter and where it should be. The
+# output port is clocked by the master clock so the edges should only move by the simulator's time step;
+# a port output that misses its timing moves the edges after it by a whole master clock period.
+MAX_EDGE_DEVIATION_UI = 0.25
+
 
 def _get_mclk_freq(sam_freq):
     if sam_freq in [48000, 96000, 192000]:
@@ -38,10 +49,17 @@ def tx_uncollect(config, sam_freq, ramps, duration):
     return False
 
 
+def tx_cost(config, sam_freq, ramps, duration):
+    core_freq = int(config.split("_")[1])
+    return duration * core_freq * 1000000 // sam_freq
+
+
 #####
 # This test builds the spdif transmitter app with a verity of presets and tests that the output matches those presets
 #####
 @pytest.mark.uncollect_if(func=tx_uncollect)
+@pytest.mark.test_levels(spec=LEVELS["test_tx"])
+@pytest.mark.cost_estimate(func=tx_cost)
 @pytest.mark.parametrize("sam_freq", SAM_FREQS)
 @pytest.mark.parametrize("config", CONFIGS)
 @pytest.mark.parametrize("duration", [params["NO_OF_SAMPLES"]])
@@ -64,19 +82,32 @@ def test_tx(capfd, config, sam_freq, duration, ramps):
         ["ramp", ramps[1]],
     ]
 
-    tester = testers.ComparisonTester(
-        Frames(channels=audio, no_of_blocks=no_of_blocks, sam_freq=sam_freq).expect()[
-            : no_of_samples * len(audio)
-        ]
-    )
+    frames = Frames(channels=audio, no_of_blocks=no_of_blocks, sam_freq=sam_freq)
+    # When a trace is recorded (see the --trace-dir option in conftest.py) it keeps the subframes, so they
+    # are checked in the simulator thread rather than printed for the tester to compare
+    check_in_thread = bool(os.environ.get("SPDIF_TRACE_FILE"))
+    if check_in_thread:
+        tester = testers.ComparisonTester("PASS")
+    else:
+        tester = testers.ComparisonTester(stream_cache.expect(frames)[: no_of_samples * len(audio)])
+    simargs = ["--max-cycles", str(MAX_CYCLES)]
+
+    # The master clock is driven at exactly mclk_freq, so the timing of the output is checked against the
+    # nominal UI rate, see the --tx-timing-report option in conftest.py
     simthreads = [
         Clock(p_clock, mclk_freq * 2),
-        Spdif_rx(p_spdif_out, freq_for_sample_rate(sam_freq), no_of_samples),
+        Spdif_rx(
+            p_spdif_out,
+            freq_for_sample_rate(sam_freq),
+            no_of_samples,
+            nominal_freq=freq_for_sample_rate(sam_freq),
+            max_edge_deviation=MAX_EDGE_DEVIATION_UI,
+            mclk_freq=mclk_freq,
+            check_frames=frames if check_in_thread else None,
+        ),
     ]
 
-    simargs = ["--max-cycles", str(MAX_CYCLES)]
-
-    result = Pyxsim.run_on_simulator_(
+    result = sim_cache.run(
         xe,
         simthreads=simthreads,
         do_xe_prebuild=False,